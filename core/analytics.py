@@ -1,31 +1,50 @@
-from peewee import fn
-from datetime import datetime
+from peewee import fn, SQL
+from datetime import datetime, date
+from itertools import islice
+import heapq
+import numpy as np
 import pandas as pd
-from database.models import Transaction
+from database.models import Transaction, SpendingAlert, RecurringRule
+from core.statistics import StatisticsStore
+from core.recurring import RecurringManager
+from core.records import TransactionRecord, to_structured_array
+from core.currency import CurrencyConverter
 from utils.crypto import CryptoManager
 from dateutil.relativedelta import relativedelta
 
 
 class FinancialAnalytics:
+    BUCKET_STEPS = {
+        "day": ("days", 1),
+        "week": ("weeks", 1),
+        "month": ("months", 1),
+        "quarter": ("months", 3),
+        "year": ("years", 1)
+    }
+
+    # Each expression maps a date to the ISO date its bucket starts on (weeks start on Monday).
+    BUCKET_SQL = {
+        "day": "DATE(date)",
+        "week": "DATE(date, 'weekday 0', '-6 days')",
+        "month": "strftime('%Y-%m-01', date)",
+        "quarter": "strftime('%Y-', date) || printf('%02d', (CAST(strftime('%m', date) AS INTEGER) - 1) / 3 * 3 + 1) || '-01'",
+        "year": "strftime('%Y-01-01', date)"
+    }
+
+    @staticmethod
+    def _month_bounds(month_date):
+        month_start = month_date.replace(day=1)
+        month_end = month_start + relativedelta(months=1, days=-1)
+        return month_start, month_end
+
     @staticmethod
     def get_monthly_balance():
-        current_month = datetime.now().month
-        current_year = datetime.now().year
-        
-        income_transactions = (Transaction.select().where(
-            (Transaction.is_income == True) &
-            (fn.strftime("%m", Transaction.date) == str(current_month).zfill(2)) &
-            (fn.strftime("%Y", Transaction.date) == str(current_year))
-        ))
-
-        expense_transactions = (Transaction.select().where(
-            (Transaction.is_income == False) &
-            (fn.strftime("%m", Transaction.date) == str(current_month).zfill(2)) &
-            (fn.strftime("%Y", Transaction.date) == str(current_year))
-        ))
-
-        income = sum([CryptoManager.decrypt_number(t.amount) for t in income_transactions])
-        expenses = sum([CryptoManager.decrypt_number(t.amount) for t in expense_transactions])
+        aggregate = FinancialAnalytics.aggregate(
+            *FinancialAnalytics._month_bounds(datetime.now().date()), granularity="month", group_by="type"
+        )
+
+        income = float(aggregate["values"][0].sum())
+        expenses = float(aggregate["values"][1].sum())
         
         return {
             "income": income,
@@ -35,24 +54,12 @@ class FinancialAnalytics:
 
     @staticmethod
     def get_expense_breakdown():
-        current_month = datetime.now().month
-        current_year = datetime.now().year
-        
-        expense_transactions = (Transaction.select().where(
-            (Transaction.is_income == False) &
-            (fn.strftime("%m", Transaction.date) == str(current_month).zfill(2)) &
-            (fn.strftime("%Y", Transaction.date) == str(current_year))
-        ))
-        
-        result = {}
-        for transaction in expense_transactions:
-            category = CryptoManager.decrypt_string(transaction.category_name)
-            amount = CryptoManager.decrypt_number(transaction.amount)
-            
-            if category in result:
-                result[category] += amount
-            else:
-                result[category] = amount
+        aggregate = FinancialAnalytics.aggregate(
+            *FinancialAnalytics._month_bounds(datetime.now().date()), granularity="month", group_by="category",
+            is_income=False
+        )
+
+        result = {category: float(aggregate["values"][i].sum()) for i, category in enumerate(aggregate["groups"])}
             
         total_expenses = sum(result.values()) or 1
 
@@ -63,53 +70,250 @@ class FinancialAnalytics:
             }
         return result
 
+    @staticmethod
+    def _record_decoder():
+        decrypt = CryptoManager.string_decrypter()
+
+        def decode(rows):
+            return [TransactionRecord(
+                id=row_id,
+                date=date.fromisoformat(iso_date),
+                category=decrypt(category_name, key_id),
+                description=decrypt(description, key_id) if description else None,
+                amount=CryptoManager.decrypt_number(amount, key_id),
+                is_income=is_income,
+                currency=currency
+            ) for row_id, iso_date, category_name, description, amount, is_income, currency, key_id in rows]
+
+        return decode
+
+    @staticmethod
+    def _record_query():
+        # DATE() hands back plain ISO strings; date.fromisoformat is much cheaper than peewee's strptime.
+        return (Transaction
+                .select(Transaction.id, fn.DATE(Transaction.date).coerce(False), Transaction.category_name,
+                        Transaction.description, Transaction.amount, Transaction.is_income, Transaction.currency,
+                        Transaction.key_id)
+                .order_by(Transaction.date.desc(), Transaction.id.desc()))
+
+    @staticmethod
+    def get_transaction_records(limit=50, as_array=False):
+        records = FinancialAnalytics._record_decoder()(FinancialAnalytics._record_query().limit(limit).tuples())
+
+        if limit is not None and len(records) == limit:
+            window_start = records[-1].date
+        else:
+            window_start = RecurringManager.earliest_start()
+
+        if window_start is not None:
+            records.extend(RecurringManager.expand(window_start, datetime.now().date(), limit=limit))
+            records.sort(key=lambda record: record.date, reverse=True)
+            records = records if limit is None else records[:limit]
+
+        return to_structured_array(records) if as_array else records
+
+    @staticmethod
+    def iter_transaction_batches(batch_size=5000):
+        decode = FinancialAnalytics._record_decoder()
+
+        def stored_records():
+            # Keyset pagination along the date index: every page is a short index range scan,
+            # where OFFSET would rescan all the pages before it.
+            query = FinancialAnalytics._record_query().limit(batch_size)
+            page = decode(query.tuples())
+            while page:
+                yield from page
+                if len(page) < batch_size:
+                    return
+                last = page[-1]
+                page = decode(query.where(
+                    (Transaction.date <= last.date) &
+                    ((Transaction.date < last.date) | (Transaction.id < last.id))
+                ).tuples())
+
+        earliest = RecurringManager.earliest_start()
+        recurring = RecurringManager.expand(earliest, datetime.now().date()) if earliest is not None else []
+
+        records = heapq.merge(stored_records(), recurring, key=lambda record: record.date, reverse=True)
+        while batch := list(islice(records, batch_size)):
+            yield batch
+
     @staticmethod
     def get_transaction_history(limit=50):
-        transactions = Transaction.select().order_by(Transaction.date.desc()).limit(limit)
-
-        data = []
-        for t in transactions:
-            data.append({
-                "id": t.id,
-                "date": t.date,
-                "category": CryptoManager.decrypt_string(t.category_name),
-                "description": CryptoManager.decrypt_string(t.description) if t.description else None,
-                "amount": CryptoManager.decrypt_number(t.amount),
-                "is_income": t.is_income
-            })
-        return pd.DataFrame(data)
+        records = FinancialAnalytics.get_transaction_records(limit)
+        return pd.DataFrame([record.as_dict() for record in records])
 
     @staticmethod
-    def get_monthly_trend():
-        result = []
+    def get_monthly_trend(months=6):
+        return FinancialAnalytics.get_trend("month", months)
 
-        current_date = datetime.now().replace(day=1)
+    @staticmethod
+    def get_trend(granularity="month", periods=6):
+        today = datetime.now().date()
+        unit, step = FinancialAnalytics.BUCKET_STEPS[granularity]
+        current_bucket = FinancialAnalytics._bucket_starts(today, today, granularity)[0].astype(object)
+        start = current_bucket - relativedelta(**{unit: step * (periods - 1)})
 
-        for i in range(6):
-            target_date = current_date - relativedelta(months=i)
-            target_year = target_date.year
-            target_month = target_date.month
+        aggregate = FinancialAnalytics.aggregate(start, today, granularity, group_by="type")
+        income = aggregate["values"][aggregate["groups"].index("income")]
+        expenses = aggregate["values"][aggregate["groups"].index("expenses")]
 
-            income_transactions = (Transaction.select().where(
-                (Transaction.is_income == True) &
-                (fn.strftime("%m", Transaction.date) == str(target_month).zfill(2)) &
-                (fn.strftime("%Y", Transaction.date) == str(target_year))
-            ))
-            expense_transactions = (Transaction.select().where(
-                (Transaction.is_income == False) &
-                (fn.strftime("%m", Transaction.date) == str(target_month).zfill(2)) &
-                (fn.strftime("%Y", Transaction.date) == str(target_year))
+        return [{
+            "month": FinancialAnalytics._bucket_label(bucket.astype(object), granularity),
+            "income": float(income[i]),
+            "expenses": float(expenses[i]),
+            "balance": float(income[i] - expenses[i])
+        } for i, bucket in enumerate(aggregate["buckets"])]
+
+    @staticmethod
+    def _bucket_starts(start, end, granularity):
+        start, end = np.datetime64(start, "D"), np.datetime64(end, "D")
+
+        if granularity == "day":
+            return np.arange(start, end + 1)
+        if granularity == "week":
+            monday = start - (start.astype(object).weekday())
+            return np.arange(monday, end + 1, 7)
+        if granularity == "month":
+            return np.arange(start.astype("datetime64[M]"), end.astype("datetime64[M]") + 1).astype("datetime64[D]")
+        if granularity == "quarter":
+            first_month = start.astype("datetime64[M]")
+            first_month -= first_month.astype(int) % 3
+            return np.arange(first_month, end.astype("datetime64[M]") + 1, 3).astype("datetime64[D]")
+        if granularity == "year":
+            return np.arange(start.astype("datetime64[Y]"), end.astype("datetime64[Y]") + 1).astype("datetime64[D]")
+        raise ValueError(f"Unknown granularity: {granularity}")
+
+    @staticmethod
+    def _bucket_label(bucket_start, granularity):
+        if granularity in ("day", "week"):
+            return bucket_start.strftime("%b %d")
+        if granularity == "month":
+            return bucket_start.strftime("%b")
+        if granularity == "quarter":
+            return f"Q{(bucket_start.month - 1) // 3 + 1} {bucket_start:%y}"
+        return bucket_start.strftime("%Y")
+
+    @staticmethod
+    def aggregate(start, end, granularity="month", group_by="category", is_income=None, include_recurring=True):
+        if group_by not in ("category", "type"):
+            raise ValueError(f"Unknown grouping: {group_by}")
+
+        buckets = FinancialAnalytics._bucket_starts(start, end, granularity)
+        base_currency = CurrencyConverter.base_currency()
+        # Other currencies need the rate of each day, so they are summed per day and converted below.
+        bucket = SQL(f"CASE WHEN currency = ? THEN {FinancialAnalytics.BUCKET_SQL[granularity]} "
+                     f"ELSE {FinancialAnalytics.BUCKET_SQL['day']} END", [base_currency])
+
+        condition = Transaction.date.between(start, end)
+        if is_income is not None:
+            condition &= (Transaction.is_income == is_income)
+
+        # One grouped query over the range for every bucket and currency; sums stay encrypted until
+        # they are back in Python. Grouping by key_id keeps every sum under a single key while a key
+        # rotation is under way.
+        rows = (Transaction
+                .select(bucket, Transaction.category_name, Transaction.is_income,
+                        fn.SUM(Transaction.amount), fn.COUNT(Transaction.id), Transaction.currency, Transaction.key_id)
+                .where(condition)
+                .group_by(bucket, Transaction.category_name, Transaction.is_income, Transaction.currency,
+                          Transaction.key_id)
+                .tuples())
+
+        if group_by == "type":
+            groups = ["income", "expenses"]
+        else:
+            groups = []
+        group_indexes = {group: i for i, group in enumerate(groups)}
+        decrypt = CryptoManager.string_decrypter()
+
+        group_ids, bucket_dates, totals, counts, currencies = [], [], [], [], []
+        for bucket_start, category_name, row_is_income, total, count, currency, key_id in rows:
+            if group_by == "type":
+                group = "income" if row_is_income else "expenses"
+            else:
+                group = decrypt(category_name, key_id)
+
+            if group not in group_indexes:
+                group_indexes[group] = len(groups)
+                groups.append(group)
+
+            group_ids.append(group_indexes[group])
+            bucket_dates.append(bucket_start)
+            totals.append(CryptoManager.decrypt_sum(total, count, key_id))
+            counts.append(count)
+            currencies.append(currency)
+
+        bucket_dates = np.array(bucket_dates, dtype="datetime64[D]")
+        totals = CurrencyConverter.convert(totals, currencies, bucket_dates)
+
+        # Recurring occurrences are generated only for this window and binned the same way.
+        recurring_ids, recurring_dates, recurring_amounts = [], [], []
+        for rule in (RecurringRule.select() if include_recurring else []):
+            if is_income is not None and rule.is_income != is_income:
+                continue
+
+            occurrences = RecurringManager.occurrence_dates(rule, start, end)
+            if not len(occurrences):
+                continue
+
+            if group_by == "type":
+                group = "income" if rule.is_income else "expenses"
+            else:
+                group = CryptoManager.decrypt_string(rule.category_name)
+            if group not in group_indexes:
+                group_indexes[group] = len(groups)
+                groups.append(group)
+
+            recurring_ids.append(np.full(len(occurrences), group_indexes[group]))
+            recurring_dates.append(occurrences)
+            recurring_amounts.append(CurrencyConverter.convert(
+                np.full(len(occurrences), CryptoManager.decrypt_number(rule.amount)),
+                np.full(len(occurrences), rule.currency),
+                occurrences
             ))
 
-            income = sum([CryptoManager.decrypt_number(t.amount) for t in income_transactions])
-            expenses = sum([CryptoManager.decrypt_number(t.amount) for t in expense_transactions])
-            month_name = target_date.strftime("%b")
+        group_ids = np.concatenate([np.array(group_ids, dtype=np.int64)] + recurring_ids)
+        bucket_dates = np.concatenate([bucket_dates] + recurring_dates)
+        totals = np.concatenate([totals] + recurring_amounts)
+        counts = np.concatenate([np.array(counts, dtype=np.int64)] + [np.ones(len(ids), dtype=np.int64) for ids in recurring_ids])
+
+        bucket_ids = np.searchsorted(buckets, bucket_dates, side="right") - 1
+        flat_ids = group_ids * len(buckets) + bucket_ids
+        size = len(groups) * len(buckets)
+
+        return {
+            "buckets": buckets,
+            "groups": groups,
+            "values": np.bincount(flat_ids, weights=totals, minlength=size).reshape(len(groups), len(buckets)),
+            "counts": np.bincount(flat_ids, weights=counts, minlength=size).astype(np.int64).reshape(len(groups), len(buckets))
+        }
+
+    @staticmethod
+    def get_category_statistics(category_name, is_income=False, window_months=3):
+        statistics = StatisticsStore.get_statistics(category_name, is_income)
+        statistics["window_total"] = StatisticsStore.window_total(category_name, is_income, window_months)
+        return statistics
+
+    @staticmethod
+    def get_spending_alerts(limit=3):
+        month_start = datetime.now().date().replace(day=1)
 
-            result.append({
-                "month": month_name,
-                "income": income,
-                "expenses": expenses,
-                "balance": income - expenses
-            })
+        alerts = (SpendingAlert
+                  .select(SpendingAlert, Transaction)
+                  .join(Transaction)
+                  .where(SpendingAlert.date >= month_start)
+                  .order_by(SpendingAlert.z_score.desc())
+                  .limit(limit))
 
-        return result[::-1]
+        return [{
+            "date": alert.date,
+            "category": CryptoManager.decrypt_string(alert.category_name),
+            "amount": CurrencyConverter.convert_one(
+                CryptoManager.decrypt_number(alert.transaction.amount, alert.transaction.key_id),
+                alert.transaction.currency,
+                alert.transaction.date
+            ),
+            "mean": alert.mean,
+            "z_score": alert.z_score
+        } for alert in alerts]
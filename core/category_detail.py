@@ -0,0 +1,114 @@
+import heapq
+from collections import OrderedDict
+from datetime import datetime, date
+from peewee import fn
+import numpy as np
+from database.db import get_data_version
+from database.models import Transaction, CategoryMonthlyTotal, RecurringRule
+from core.records import TransactionRecord
+from core.recurring import RecurringManager
+from core.currency import CurrencyConverter
+from core.settings_store import SettingsStore
+from utils.crypto import CryptoManager
+
+
+class CategoryDetail:
+    PAGE_SIZE = 50
+
+    # Decrypted pages, least recently used first, plus the (date, id) each full page ends on.
+    _pages = OrderedDict()
+    _cursors = {}
+    _data_version = None
+
+    @classmethod
+    def _check_version(cls):
+        data_version = get_data_version()
+        if data_version != cls._data_version:
+            cls._pages.clear()
+            cls._cursors.clear()
+            cls._data_version = data_version
+
+    @staticmethod
+    def monthly_series(category_name, is_income=False):
+        # The statistics store already keeps base-currency totals per month, so the series
+        # costs one indexed lookup instead of a pass over the category's history.
+        totals = {month: total for month, total in (CategoryMonthlyTotal
+                  .select(CategoryMonthlyTotal.month, CategoryMonthlyTotal.total)
+                  .where((CategoryMonthlyTotal.category_name == CryptoManager.encrypt_string(category_name)) &
+                         (CategoryMonthlyTotal.is_income == is_income))
+                  .tuples())}
+
+        today = datetime.now().date()
+        for rule in RecurringRule.select().where(RecurringRule.is_income == is_income):
+            if CryptoManager.decrypt_string(rule.category_name) != category_name:
+                continue
+
+            occurrences = RecurringManager.occurrence_dates(rule, rule.start_date, today)
+            amounts = CurrencyConverter.convert(
+                np.full(len(occurrences), CryptoManager.decrypt_number(rule.amount)),
+                np.full(len(occurrences), rule.currency),
+                occurrences
+            )
+            for month, amount in zip(occurrences.astype("datetime64[M]").astype(str), amounts.tolist()):
+                totals[month] = totals.get(month, 0.0) + amount
+
+        return [{"month": month, "total": totals[month]} for month in sorted(totals)]
+
+    @classmethod
+    def get_page(cls, category_name, page=0, is_income=False):
+        cls._check_version()
+
+        key = (category_name, is_income, page)
+        if key in cls._pages:
+            cls._pages.move_to_end(key)
+            return cls._pages[key]
+
+        cursor = None
+        if page > 0:
+            cursor = cls._cursors.get((category_name, is_income, page - 1))
+            if cursor is None:
+                previous = cls.get_page(category_name, page - 1, is_income)
+                if len(previous) < cls.PAGE_SIZE:
+                    return []
+                cursor = cls._cursors[category_name, is_income, page - 1]
+
+        records = cls._load_page(category_name, is_income, cursor)
+        if len(records) == cls.PAGE_SIZE:
+            cls._cursors[key] = (records[-1].date, records[-1].id)
+
+        cls._pages[key] = records
+        while len(cls._pages) > SettingsStore.get("cache_limit"):
+            cls._pages.popitem(last=False)
+        return records
+
+    @classmethod
+    def _load_page(cls, category_name, is_income, cursor):
+        # Rows encrypted under different keys have different category ciphertexts, so each key
+        # gets its own walk down the (category_name, date) index and the walks are merged.
+        walks = []
+        for key_id in CryptoManager.key_material():
+            query = (Transaction
+                     .select(Transaction.id, fn.DATE(Transaction.date).coerce(False), Transaction.description,
+                             Transaction.amount, Transaction.currency)
+                     .where((Transaction.category_name == CryptoManager.encrypt_string(category_name, key_id)) &
+                            (Transaction.key_id == key_id) &
+                            (Transaction.is_income == is_income))
+                     .order_by(Transaction.date.desc(), Transaction.id.desc())
+                     .limit(cls.PAGE_SIZE))
+            if cursor is not None:
+                last_date, last_id = cursor
+                query = query.where((Transaction.date <= last_date) &
+                                    ((Transaction.date < last_date) | (Transaction.id < last_id)))
+
+            walks.append([TransactionRecord(
+                id=row_id,
+                date=date.fromisoformat(iso_date),
+                category=category_name,
+                description=CryptoManager.decrypt_string(description, key_id) if description else None,
+                amount=CryptoManager.decrypt_number(amount, key_id),
+                is_income=is_income,
+                currency=currency
+            ) for row_id, iso_date, description, amount, currency in query.tuples()])
+
+        merged = heapq.merge(*walks, key=lambda record: (record.date, record.id), reverse=True)
+        return [record for _, record in zip(range(cls.PAGE_SIZE), merged)]
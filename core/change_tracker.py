@@ -0,0 +1,30 @@
+from database.db import db
+
+
+class ChangeTracker:
+    POLL_INTERVAL_MS = 1000
+
+    _generation = 0
+    _seen = None
+
+    @classmethod
+    def _probe(cls):
+        # PRAGMA data_version moves when any other connection commits (a second app instance, an
+        # importer, or a worker thread), and total_changes counts this connection's own writes.
+        # Neither reads a table, so probing is practically free.
+        connection = db.connection()
+        return id(connection), connection.execute("PRAGMA data_version").fetchone()[0], connection.total_changes
+
+    @classmethod
+    def generation(cls):
+        # Must be called from the UI thread, since peewee hands every thread its own connection.
+        probe = cls._probe()
+        if probe != cls._seen:
+            cls._seen = probe
+            cls._generation += 1
+        return cls._generation
+
+    @classmethod
+    def bump(cls):
+        # For changes SQLite cannot see from this connection, such as a restore that replaced the file.
+        cls._generation += 1
@@ -0,0 +1,107 @@
+import csv
+from datetime import datetime
+import numpy as np
+from database.db import db, get_data_version
+from database.models import ExchangeRate, Transaction
+from core.settings_store import SettingsStore
+
+
+class CurrencyConverter:
+    # Rate tables are dropped whenever the data version moves, so rates imported by another
+    # instance or brought back by a restore are picked up without a restart.
+    _rate_tables = {}
+    _data_version = None
+
+    @staticmethod
+    def _check_version():
+        data_version = get_data_version()
+        if data_version != CurrencyConverter._data_version:
+            CurrencyConverter._rate_tables.clear()
+            CurrencyConverter._data_version = data_version
+
+    @staticmethod
+    def base_currency():
+        return SettingsStore.get("base_currency")
+
+    @staticmethod
+    def import_rates_csv(file_path):
+        try:
+            with open(file_path, newline="") as file:
+                reader = csv.DictReader(file)
+                rates = [{
+                    "currency": row["currency"].strip().upper(),
+                    "date": datetime.strptime(row["date"].strip(), "%Y-%m-%d").date(),
+                    "rate": float(row["rate"])
+                } for row in reader]
+        except FileNotFoundError:
+            return False, f"Error: The file '{file_path}' does not exist."
+        except (KeyError, ValueError):
+            return False, "Error: The file must have date (YYYY-MM-DD), currency and rate columns."
+
+        if not rates:
+            return False, "No exchange rates found in the file"
+
+        from core.statistics import StatisticsStore
+
+        with db.atomic():
+            for start in range(0, len(rates), 500):
+                ExchangeRate.insert_many(rates[start:start + 500]).on_conflict_replace().execute()
+            CurrencyConverter._rate_tables.clear()
+
+            # The statistics hold amounts converted at the old rates, and deleting a transaction
+            # subtracts its amount converted at the current ones, so they are recomputed here.
+            currencies = {rate["currency"] for rate in rates}
+            if Transaction.select().where(Transaction.currency.in_(currencies)).exists():
+                StatisticsStore.rebuild()
+
+        return True, f"Imported {len(rates)} exchange rates"
+
+    @staticmethod
+    def has_rates(currency):
+        CurrencyConverter._check_version()
+        return currency == CurrencyConverter.base_currency() or len(CurrencyConverter._rate_table(currency)[0]) > 0
+
+    @staticmethod
+    def _rate_table(currency):
+        # Sorted (dates, rates) arrays per currency, loaded once and reused for every lookup.
+        if currency not in CurrencyConverter._rate_tables:
+            rows = list(ExchangeRate
+                        .select(ExchangeRate.date, ExchangeRate.rate)
+                        .where(ExchangeRate.currency == currency)
+                        .order_by(ExchangeRate.date)
+                        .tuples())
+            dates, rates = zip(*rows) if rows else ((), ())
+            CurrencyConverter._rate_tables[currency] = (
+                np.array(dates, dtype="datetime64[D]"),
+                np.array(rates, dtype=np.float64)
+            )
+        return CurrencyConverter._rate_tables[currency]
+
+    @staticmethod
+    def convert(amounts, currencies, dates):
+        amounts = np.asarray(amounts, dtype=np.float64)
+        currencies = np.asarray(currencies)
+        dates = np.asarray(dates, dtype="datetime64[D]")
+
+        converted = amounts.copy()
+        base_currency = CurrencyConverter.base_currency()
+        CurrencyConverter._check_version()
+        for currency in np.unique(currencies):
+            if currency == base_currency:
+                continue
+
+            rate_dates, rates = CurrencyConverter._rate_table(currency)
+            # Currencies without any rates are left unconverted; entry forms only accept known ones.
+            if not len(rates):
+                continue
+
+            # As-of join: each amount uses the latest rate on or before its date,
+            # or the earliest known rate for dates before the history starts.
+            mask = currencies == currency
+            indexes = np.searchsorted(rate_dates, dates[mask], side="right") - 1
+            converted[mask] = amounts[mask] * rates[np.maximum(indexes, 0)]
+        return converted
+
+    @staticmethod
+    def convert_one(amount, currency, date):
+        return float(CurrencyConverter.convert([amount], [currency], [date])[0])
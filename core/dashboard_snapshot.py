@@ -0,0 +1,46 @@
+import json
+import os
+from datetime import datetime, date
+from database.db import db, get_data_version
+from utils.crypto import CryptoManager
+
+
+class DashboardSnapshot:
+    FILE_NAME = "dashboard_snapshot.json"
+
+    @staticmethod
+    def _path():
+        return os.path.join(os.path.dirname(os.path.abspath(db.database)), DashboardSnapshot.FILE_NAME)
+
+    @staticmethod
+    def current_stamp():
+        # Month totals and recurring occurrences depend on today's date as well as on the data.
+        return {"data_version": get_data_version(), "date": datetime.now().date().isoformat()}
+
+    @staticmethod
+    def save(stamp, data):
+        data = dict(data, alerts=[dict(alert, date=alert["date"].isoformat()) for alert in data["alerts"]])
+
+        # Category names and amounts are encrypted here just like in the database next to it.
+        temp_path = DashboardSnapshot._path() + ".tmp"
+        try:
+            key_id = CryptoManager.active_key_id()
+            payload = CryptoManager.encrypt_string(json.dumps(data), key_id)
+            with open(temp_path, "w") as file:
+                json.dump({"stamp": stamp, "key_id": key_id, "data": payload}, file)
+            os.replace(temp_path, DashboardSnapshot._path())
+            return True
+        except (OSError, TypeError, ValueError):
+            return False
+
+    @staticmethod
+    def load():
+        try:
+            with open(DashboardSnapshot._path()) as file:
+                snapshot = json.load(file)
+            data = json.loads(CryptoManager.decrypt_string(snapshot["data"], snapshot["key_id"]))
+            data["alerts"] = [dict(alert, date=date.fromisoformat(alert["date"])) for alert in data["alerts"]]
+            return snapshot["stamp"], data
+        except (OSError, KeyError, TypeError, ValueError):
+            # Also covers snapshots written before they were encrypted, or under a key that is gone.
+            return None, None
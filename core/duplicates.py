@@ -0,0 +1,179 @@
+import hashlib
+from datetime import date, timedelta
+from peewee import fn
+import numpy as np
+from database.db import db
+from database.models import Transaction, TransactionFingerprint
+from core.records import TransactionRecord, as_date
+from utils.crypto import CryptoManager
+
+
+class DuplicateDetector:
+    WINDOW_DAYS = 3
+
+    @staticmethod
+    def _hash(*parts):
+        # Keyed, because amounts, currencies and categories are few enough to hash every combination.
+        return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16,
+                               key=CryptoManager.fingerprint_key()).hexdigest()
+
+    @staticmethod
+    def fingerprints(amount, category_name, description, date, currency):
+        # The exact key covers every field; the loose key leaves out the date and description
+        # so near-misses can be found by a date range lookup within it.
+        amount_key = f"{amount:.2f}"
+        category_key = category_name.strip().lower()
+        exact = DuplicateDetector._hash(as_date(date).isoformat(), amount_key, currency,
+                                        category_key, (description or "").strip().lower())
+        loose = DuplicateDetector._hash(amount_key, currency, category_key)
+        return exact, loose
+
+    @staticmethod
+    def index(transaction_id, amount, category_name, description, date, currency):
+        exact, loose = DuplicateDetector.fingerprints(amount, category_name, description, date, currency)
+        TransactionFingerprint.create(
+            transaction=transaction_id,
+            fingerprint=exact,
+            loose_fingerprint=loose,
+            date=as_date(date)
+        )
+
+    @staticmethod
+    def unindex(transaction_id):
+        TransactionFingerprint.delete().where(TransactionFingerprint.transaction == transaction_id).execute()
+
+    @staticmethod
+    def find_duplicates(amount, category_name, description, date, currency, window_days=0):
+        return DuplicateDetector.flag_batch([(amount, category_name, description, date, currency)], window_days)[0]
+
+    @staticmethod
+    def flag_batch(rows, window_days=0):
+        # rows are (amount, category, description, date, currency) tuples. Returns, for every row,
+        # the ids of stored transactions it duplicates, or that match it within window_days.
+        keys = [DuplicateDetector.fingerprints(*row) for row in rows]
+
+        exact_matches = {}
+        exact_keys = list({exact for exact, _ in keys})
+        for start in range(0, len(exact_keys), 500):
+            for fingerprint, transaction_id in (TransactionFingerprint
+                                                .select(TransactionFingerprint.fingerprint,
+                                                        TransactionFingerprint.transaction)
+                                                .where(TransactionFingerprint.fingerprint.in_(exact_keys[start:start + 500]))
+                                                .tuples()):
+                exact_matches.setdefault(fingerprint, []).append(transaction_id)
+
+        # Sorted (dates, ids) arrays per loose key, so each row's window is two binary searches.
+        loose_tables = {}
+        if window_days:
+            loose_tables = DuplicateDetector._load_windows(keys, rows, window_days)
+
+        results = []
+        for (exact, loose), row in zip(keys, rows):
+            matches = list(exact_matches.get(exact, []))
+            if loose in loose_tables:
+                dates, ids = loose_tables[loose]
+                day = np.datetime64(as_date(row[3]), "D")
+                low = np.searchsorted(dates, day - window_days, side="left")
+                high = np.searchsorted(dates, day + window_days, side="right")
+                matches.extend(transaction_id for transaction_id in ids[low:high].tolist() if transaction_id not in matches)
+            results.append(matches)
+        return results
+
+    @staticmethod
+    def _load_windows(keys, rows, window_days):
+        # Only the dates around each row are read, as range scans on the (loose_fingerprint, date)
+        # index. Overlapping windows of rows with the same loose key are merged first.
+        spans = {}
+        for (_, loose), row in zip(keys, rows):
+            day = as_date(row[3])
+            spans.setdefault(loose, []).append((day - timedelta(days=window_days), day + timedelta(days=window_days)))
+
+        ranges = []
+        for loose, windows in spans.items():
+            windows.sort()
+            low, high = windows[0]
+            for next_low, next_high in windows[1:]:
+                if next_low > high:
+                    ranges.append((loose, low, high))
+                    low = next_low
+                high = max(high, next_high)
+            ranges.append((loose, low, high))
+
+        grouped = {}
+        for loose, low, high in ranges:
+            for transaction_id, day in (TransactionFingerprint
+                                        .select(TransactionFingerprint.transaction, TransactionFingerprint.date)
+                                        .where((TransactionFingerprint.loose_fingerprint == loose) &
+                                               TransactionFingerprint.date.between(low, high))
+                                        .order_by(TransactionFingerprint.date)
+                                        .tuples()):
+                grouped.setdefault(loose, ([], []))
+                grouped[loose][0].append(day)
+                grouped[loose][1].append(transaction_id)
+
+        return {fingerprint: (np.array(dates, dtype="datetime64[D]"), np.array(ids, dtype=np.int64))
+                for fingerprint, (dates, ids) in grouped.items()}
+
+    @staticmethod
+    def get_matches(transaction_ids):
+        transactions = Transaction.select().where(Transaction.id.in_(transaction_ids)).order_by(Transaction.date.desc())
+        return [TransactionRecord(
+            id=transaction.id,
+            date=transaction.date,
+            category=CryptoManager.decrypt_string(transaction.category_name, transaction.key_id),
+            description=(CryptoManager.decrypt_string(transaction.description, transaction.key_id)
+                         if transaction.description else None),
+            amount=CryptoManager.decrypt_number(transaction.amount, transaction.key_id),
+            is_income=transaction.is_income,
+            currency=transaction.currency
+        ) for transaction in transactions]
+
+    @staticmethod
+    def is_current():
+        # Recomputing the newest fingerprint tells whether the index was built with the current
+        # fingerprint key; older versions did not key them at all.
+        fingerprint = (TransactionFingerprint
+                       .select(TransactionFingerprint, Transaction)
+                       .join(Transaction)
+                       .order_by(TransactionFingerprint.id.desc())
+                       .first())
+        if fingerprint is None:
+            return not Transaction.select().exists()
+
+        transaction = fingerprint.transaction
+        exact, _ = DuplicateDetector.fingerprints(
+            CryptoManager.decrypt_number(transaction.amount, transaction.key_id),
+            CryptoManager.decrypt_string(transaction.category_name, transaction.key_id),
+            CryptoManager.decrypt_string(transaction.description, transaction.key_id) if transaction.description else "",
+            transaction.date,
+            transaction.currency
+        )
+        return exact == fingerprint.fingerprint
+
+    @staticmethod
+    def rebuild():
+        decrypt = CryptoManager.string_decrypter()
+        fingerprints = []
+        for transaction_id, amount, category_name, description, iso_date, currency, key_id in (Transaction
+                .select(Transaction.id, Transaction.amount, Transaction.category_name, Transaction.description,
+                        fn.DATE(Transaction.date).coerce(False), Transaction.currency, Transaction.key_id)
+                .tuples()):
+            day = date.fromisoformat(iso_date)
+            exact, loose = DuplicateDetector.fingerprints(
+                CryptoManager.decrypt_number(amount, key_id),
+                decrypt(category_name, key_id),
+                decrypt(description, key_id) if description else "",
+                day,
+                currency
+            )
+            fingerprints.append((transaction_id, exact, loose, iso_date))
+
+        # Building peewee insert queries for every row costs more than the hashing, so the
+        # rows go straight to the driver.
+        with db.atomic():
+            TransactionFingerprint.delete().execute()
+            db.connection().executemany(
+                f'INSERT INTO "{TransactionFingerprint._meta.table_name}" '
+                f'(transaction_id, fingerprint, loose_fingerprint, date) VALUES (?, ?, ?, ?)',
+                fingerprints
+            )
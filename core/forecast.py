@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
+import numpy as np
+from database.db import get_data_version
+from database.models import RecurringRule
+from core.analytics import FinancialAnalytics
+from core.recurring import RecurringManager
+from core.currency import CurrencyConverter
+from utils.crypto import CryptoManager
+
+
+class CashFlowForecaster:
+    HISTORY_MONTHS = 24
+    SMOOTHING = 0.3
+    # Telling a seasonal pattern apart from a one-off change takes at least two full years.
+    SEASONAL_MONTHS = 24
+    _cache = {}
+
+    @classmethod
+    def forecast(cls, months=6):
+        this_month = datetime.now().date().replace(day=1)
+        key = (get_data_version(), this_month, months)
+
+        # Results only change when the data or the month does, so one entry is enough.
+        if key not in cls._cache:
+            cls._cache.clear()
+            cls._cache[key] = cls._compute(this_month, months)
+        return cls._cache[key]
+
+    @classmethod
+    def _compute(cls, this_month, months):
+        history_start = this_month - relativedelta(months=cls.HISTORY_MONTHS)
+        history_end = this_month - timedelta(days=1)
+
+        # Recurring rules are known exactly, so the fit only sees one-off transactions.
+        income = FinancialAnalytics.aggregate(history_start, history_end, "month", "category", is_income=True,
+                                              include_recurring=False)
+        expenses = FinancialAnalytics.aggregate(history_start, history_end, "month", "category", is_income=False,
+                                                include_recurring=False)
+
+        # One signed row per (category, type); every step below runs on all rows at once.
+        series = np.vstack([income["values"], -expenses["values"]])
+        history_months = income["buckets"].astype("datetime64[M]").astype(np.int64) % 12
+
+        first_future = np.datetime64(this_month, "M") + 1
+        future_buckets = np.arange(first_future, first_future + months)
+        future_months = future_buckets.astype(np.int64) % 12
+
+        projected = np.zeros(months)
+        if len(series):
+            # Months before a category's first transaction are not observations of it, so every
+            # statistic below only looks at each row from its first non-zero month on.
+            observed = np.cumsum(series != 0, axis=1) > 0
+            observed_count = observed.sum(axis=1)
+            mean = np.where(observed, series, 0.0).sum(axis=1, keepdims=True) / np.maximum(observed_count, 1)[:, None]
+
+            seasonal = np.zeros((len(series), 12))
+            month_count = np.zeros((len(series), 12))
+            np.add.at(seasonal.T, history_months, np.where(observed, series - mean, 0.0).T)
+            np.add.at(month_count.T, history_months, observed.T)
+            seasonal = np.where(observed_count[:, None] >= cls.SEASONAL_MONTHS, seasonal / np.maximum(month_count, 1), 0.0)
+
+            deseasonalized = series - seasonal[:, history_months]
+            level = deseasonalized[np.arange(len(series)), observed.argmax(axis=1)]
+            for column, is_observed in zip(deseasonalized.T, observed.T):
+                level = np.where(is_observed, cls.SMOOTHING * column + (1 - cls.SMOOTHING) * level, level)
+
+            projected += (level[:, None] + seasonal[:, future_months]).sum(axis=0)
+
+        horizon_start = future_buckets[0].astype("datetime64[D]")
+        horizon_end = (future_buckets[-1] + 1).astype("datetime64[D]") - 1
+        for rule in RecurringRule.select():
+            occurrences = RecurringManager.occurrence_dates(rule, horizon_start.astype(object), horizon_end.astype(object),
+                                                            include_future=True)
+            if not len(occurrences):
+                continue
+
+            # Future dates fall past the last known rate, so the latest rate is used.
+            amounts = CurrencyConverter.convert(
+                np.full(len(occurrences), CryptoManager.decrypt_number(rule.amount)),
+                np.full(len(occurrences), rule.currency),
+                occurrences
+            ) * (1 if rule.is_income else -1)
+            bucket_ids = occurrences.astype("datetime64[M]").astype(np.int64) - first_future.astype(np.int64)
+            projected += np.bincount(bucket_ids, weights=amounts, minlength=months)
+
+        return [{
+            "month": bucket.astype(object).strftime("%b"),
+            "balance": float(balance)
+        } for bucket, balance in zip(future_buckets.astype("datetime64[D]"), projected)]
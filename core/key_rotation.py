@@ -0,0 +1,132 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from peewee import DatabaseError
+from database.db import db
+from database.models import Transaction, RecurringRule, KeyRotation
+from core.statistics import StatisticsStore
+from utils.crypto import CryptoManager
+
+
+class KeyRotationManager:
+    CHUNK_SIZE = 2000
+    WORKERS = max((os.cpu_count() or 1) - 1, 1)
+
+    @staticmethod
+    def pending_rotation():
+        return (KeyRotation
+                .select()
+                .where(KeyRotation.finished.is_null())
+                .order_by(KeyRotation.id.desc())
+                .first())
+
+    @staticmethod
+    def rotate(progress=None):
+        # Starts a rotation to a fresh key, or resumes the one that was interrupted. Until it
+        # finishes, new rows keep using the old active key and every row is read with its own key_id.
+        try:
+            rotation = KeyRotationManager.pending_rotation()
+            if rotation is None:
+                rotation = KeyRotation.create(source_key_id=CryptoManager.active_key_id(),
+                                              target_key_id=CryptoManager.add_key())
+
+            KeyRotationManager._reencrypt_transactions(rotation, progress)
+            KeyRotationManager._finish(rotation)
+            return True, f"Data re-encrypted with key {rotation.target_key_id}"
+        except (DatabaseError, OSError, BrokenProcessPool) as error:
+            return False, f"Key rotation stopped: {error}. Rotate again to resume."
+        except KeyError as error:
+            return False, f"Key rotation stopped: key {error} is missing from keyring.json."
+
+    @staticmethod
+    def _chunks(rotation):
+        last_id = rotation.last_id
+        while True:
+            rows = list(Transaction
+                        .select(Transaction.id, Transaction.amount, Transaction.category_name,
+                                Transaction.description, Transaction.key_id)
+                        .where((Transaction.id > last_id) & (Transaction.key_id != rotation.target_key_id))
+                        .order_by(Transaction.id)
+                        .limit(KeyRotationManager.CHUNK_SIZE)
+                        .tuples())
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield rows
+
+    @staticmethod
+    def _reencrypt_transactions(rotation, progress):
+        total = Transaction.select().where(Transaction.key_id != rotation.target_key_id).count()
+        done = 0
+
+        # Workers only do the decrypt/encrypt work; this thread stays the single writer and
+        # commits each chunk together with the checkpoint, so an interrupted run loses at most
+        # the chunks that were still in flight.
+        with ProcessPoolExecutor(max_workers=KeyRotationManager.WORKERS,
+                                 mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=CryptoManager.load_keys,
+                                 initargs=(CryptoManager.key_material(),)) as pool:
+            in_flight = deque()
+            for rows in KeyRotationManager._chunks(rotation):
+                in_flight.append((rows[-1][0], pool.submit(CryptoManager.reencrypt_rows, rows, rotation.target_key_id)))
+                if len(in_flight) >= KeyRotationManager.WORKERS * 2:
+                    done += KeyRotationManager._write_chunk(rotation, *in_flight.popleft())
+                    if progress:
+                        progress(done, total)
+
+            while in_flight:
+                done += KeyRotationManager._write_chunk(rotation, *in_flight.popleft())
+                if progress:
+                    progress(done, total)
+
+    @staticmethod
+    def _write_chunk(rotation, last_id, future):
+        rows = future.result()
+        with db.atomic():
+            KeyRotationManager._update_transactions(rows)
+            rotation.last_id = last_id
+            rotation.save(only=[KeyRotation.last_id])
+        return len(rows)
+
+    @staticmethod
+    def _update_transactions(rows):
+        db.connection().executemany(
+            f'UPDATE "{Transaction._meta.table_name}" '
+            f'SET amount = ?, category_name = ?, description = ?, key_id = ? WHERE id = ?',
+            rows
+        )
+
+    @staticmethod
+    def _finish(rotation):
+        source, target = rotation.source_key_id, rotation.target_key_id
+        try:
+            with db.atomic():
+                # Rows added while the chunks ran still use the source key.
+                leftover = list(Transaction
+                                .select(Transaction.id, Transaction.amount, Transaction.category_name,
+                                        Transaction.description, Transaction.key_id)
+                                .where(Transaction.key_id != target)
+                                .tuples())
+                KeyRotationManager._update_transactions(CryptoManager.reencrypt_rows(leftover, target))
+
+                for rule in RecurringRule.select():
+                    rule.amount = CryptoManager.encrypt_number(CryptoManager.decrypt_number(rule.amount, source), target)
+                    rule.category_name = CryptoManager.encrypt_string(
+                        CryptoManager.decrypt_string(rule.category_name, source), target)
+                    if rule.description:
+                        rule.description = CryptoManager.encrypt_string(
+                            CryptoManager.decrypt_string(rule.description, source), target)
+                    rule.save()
+
+                rotation.finished = datetime.now()
+                rotation.save()
+
+                # The statistics tables are keyed by encrypted category names; rebuilding them
+                # under the new active key switches over in the same transaction.
+                CryptoManager.reload()
+                StatisticsStore.rebuild()
+        finally:
+            CryptoManager.reload()
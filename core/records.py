@@ -0,0 +1,57 @@
+from datetime import datetime
+import numpy as np
+
+
+def as_date(value):
+    # Transactions carry datetimes and recurring rules dates; both are compared as dates.
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+class TransactionRecord:
+    __slots__ = ("id", "date", "category", "description", "amount", "is_income", "rule_id", "currency")
+
+    def __init__(self, id, date, category, description, amount, is_income, rule_id=None, currency="USD"):
+        self.id = id
+        self.date = date
+        self.category = category
+        self.description = description
+        self.amount = amount
+        self.is_income = is_income
+        self.rule_id = rule_id
+        self.currency = currency
+
+    @property
+    def is_recurring(self):
+        return self.rule_id is not None
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+# Recurring occurrences have no row of their own, so they get id 0 and a non-zero rule_id.
+# Text columns hold references, so repeated category names share one string object.
+TRANSACTION_DTYPE = np.dtype([
+    ("id", np.int64),
+    ("date", "datetime64[D]"),
+    ("category", object),
+    ("description", object),
+    ("amount", np.float64),
+    ("is_income", np.bool_),
+    ("rule_id", np.int64),
+    ("currency", "U3")
+])
+
+
+def to_structured_array(records):
+    return np.array([(
+        0 if record.is_recurring else record.id,
+        record.date,
+        record.category,
+        record.description or "",
+        record.amount,
+        record.is_income,
+        record.rule_id or 0,
+        record.currency
+    ) for record in records], dtype=TRANSACTION_DTYPE)
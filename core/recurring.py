@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
+import numpy as np
+from database.models import RecurringRule
+from core.records import TransactionRecord, as_date
+from core.currency import CurrencyConverter
+from utils.crypto import CryptoManager
+
+
+class RecurringManager:
+    INTERVAL_UNITS = ("day", "week", "month", "year")
+
+    @staticmethod
+    def add_rule(amount, category_name, description="", is_income=False, start_date=None,
+                 interval_unit="month", interval_count=1, end_date=None, currency=None):
+        if interval_unit not in RecurringManager.INTERVAL_UNITS:
+            raise ValueError(f"Unknown interval unit: {interval_unit}")
+
+        rule = RecurringRule.create(
+            amount=CryptoManager.encrypt_number(amount),
+            category_name=CryptoManager.encrypt_string(category_name),
+            description=CryptoManager.encrypt_string(description) if description else "",
+            is_income=is_income,
+            start_date=datetime.now().date() if start_date is None else start_date,
+            end_date=end_date,
+            interval_unit=interval_unit,
+            interval_count=interval_count,
+            currency=CurrencyConverter.base_currency() if currency is None else currency
+        )
+        return rule
+
+    @staticmethod
+    def delete_rule(rule_id):
+        rule = RecurringRule.get_or_none(RecurringRule.id == rule_id)
+        if rule:
+            rule.delete_instance()
+            return True
+        return False
+
+    @staticmethod
+    def _occurrence(rule, index):
+        step = rule.interval_count * index
+        if rule.interval_unit == "day":
+            return rule.start_date + timedelta(days=step)
+        if rule.interval_unit == "week":
+            return rule.start_date + timedelta(weeks=step)
+        if rule.interval_unit == "month":
+            return rule.start_date + relativedelta(months=step)
+        return rule.start_date + relativedelta(years=step)
+
+    @staticmethod
+    def _index_range(rule, start, end):
+        # Closed-form bounds [first, last] of the occurrence indexes that fall inside [start, end].
+        start = max(as_date(start), rule.start_date)
+        end = as_date(end)
+        if rule.end_date is not None:
+            end = min(end, rule.end_date)
+        if end < start:
+            return 0, -1
+
+        if rule.interval_unit in ("day", "week"):
+            step = rule.interval_count * (7 if rule.interval_unit == "week" else 1)
+            first = -(-(start - rule.start_date).days // step)
+            last = (end - rule.start_date).days // step
+            return first, last
+
+        step = rule.interval_count * (12 if rule.interval_unit == "year" else 1)
+        first = -(-RecurringManager._months_between(rule.start_date, start) // step)
+        if RecurringManager._occurrence(rule, first) < start:
+            first += 1
+        last = RecurringManager._months_between(rule.start_date, end) // step
+        if RecurringManager._occurrence(rule, last) > end:
+            last -= 1
+        return first, last
+
+    @staticmethod
+    def _months_between(start, end):
+        return (end.year - start.year) * 12 + end.month - start.month
+
+    @staticmethod
+    def _clip_to_today(end):
+        return min(as_date(end), datetime.now().date())
+
+    @staticmethod
+    def occurrence_dates(rule, start, end, include_future=False):
+        if not include_future:
+            end = RecurringManager._clip_to_today(end)
+
+        first, last = RecurringManager._index_range(rule, start, end)
+        if last < first:
+            return np.array([], dtype="datetime64[D]")
+
+        if rule.interval_unit in ("day", "week"):
+            step = rule.interval_count * (7 if rule.interval_unit == "week" else 1)
+            return np.datetime64(rule.start_date, "D") + np.arange(first, last + 1) * step
+        return np.array([RecurringManager._occurrence(rule, index) for index in range(first, last + 1)],
+                        dtype="datetime64[D]")
+
+    @staticmethod
+    def expand(start, end, limit=None, include_future=False):
+        if not include_future:
+            end = RecurringManager._clip_to_today(end)
+
+        rows = []
+        for rule in RecurringRule.select():
+            first, last = RecurringManager._index_range(rule, start, end)
+            if limit is not None:
+                first = max(first, last - limit + 1)
+            if last < first:
+                continue
+
+            category = CryptoManager.decrypt_string(rule.category_name)
+            description = CryptoManager.decrypt_string(rule.description) if rule.description else None
+            amount = CryptoManager.decrypt_number(rule.amount)
+
+            for index in range(last, first - 1, -1):
+                occurrence = RecurringManager._occurrence(rule, index)
+                rows.append(TransactionRecord(
+                    id=f"R{rule.id}:{occurrence:%Y-%m-%d}",
+                    date=occurrence,
+                    category=category,
+                    description=description,
+                    amount=amount,
+                    is_income=rule.is_income,
+                    rule_id=rule.id,
+                    currency=rule.currency
+                ))
+
+        rows.sort(key=lambda row: row.date, reverse=True)
+        return rows if limit is None else rows[:limit]
+
+    @staticmethod
+    def earliest_start():
+        rule = RecurringRule.select().order_by(RecurringRule.start_date).first()
+        return rule.start_date if rule else None
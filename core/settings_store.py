@@ -0,0 +1,45 @@
+from database.models import Settings
+
+
+class SettingsStore:
+    _settings = None
+    _subscribers = {}
+
+    @classmethod
+    def load(cls):
+        if cls._settings is None:
+            cls._settings = Settings.select().first()
+        return cls._settings
+
+    @classmethod
+    def reload(cls):
+        cls._settings = None
+        settings = cls.load()
+        for key, callbacks in cls._subscribers.items():
+            for callback in list(callbacks):
+                callback(getattr(settings, key))
+
+    @classmethod
+    def get(cls, key):
+        return getattr(cls.load(), key)
+
+    @classmethod
+    def set(cls, key, value):
+        settings = cls.load()
+        if getattr(settings, key) == value:
+            return
+
+        setattr(settings, key, value)
+        settings.save(only=[getattr(Settings, key)])
+
+        for callback in list(cls._subscribers.get(key, [])):
+            callback(value)
+
+    @classmethod
+    def subscribe(cls, key, callback):
+        cls._subscribers.setdefault(key, []).append(callback)
+
+    @classmethod
+    def unsubscribe(cls, key, callback):
+        if callback in cls._subscribers.get(key, []):
+            cls._subscribers[key].remove(callback)
@@ -0,0 +1,184 @@
+import math
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+from peewee import fn
+from database.db import db
+from database.models import Transaction, CategoryStatistic, CategoryMonthlyTotal, SpendingAlert
+from core.currency import CurrencyConverter
+from utils.crypto import CryptoManager
+
+
+class StatisticsStore:
+    ALERT_THRESHOLD = 3.0
+    MIN_SAMPLES = 5
+
+    @staticmethod
+    def _month_key(date):
+        return date.strftime("%Y-%m")
+
+    @staticmethod
+    def record(transaction_id, amount, category_name, is_income, date):
+        encrypted_category = CryptoManager.encrypt_string(category_name)
+
+        with db.atomic():
+            stat, _ = CategoryStatistic.get_or_create(category_name=encrypted_category, is_income=is_income)
+
+            # Score against the norm as it was before this transaction joined it.
+            z_score = StatisticsStore._z_score(stat, amount)
+            if not is_income and z_score is not None and z_score >= StatisticsStore.ALERT_THRESHOLD:
+                SpendingAlert.create(
+                    transaction=transaction_id,
+                    category_name=encrypted_category,
+                    z_score=z_score,
+                    mean=stat.mean,
+                    date=date
+                )
+
+            # Welford's online update of count, mean and sum of squared deviations.
+            stat.count += 1
+            delta = amount - stat.mean
+            stat.mean += delta / stat.count
+            stat.m2 += delta * (amount - stat.mean)
+            stat.save()
+
+            bucket, _ = CategoryMonthlyTotal.get_or_create(
+                category_name=encrypted_category,
+                is_income=is_income,
+                month=StatisticsStore._month_key(date)
+            )
+            bucket.total += amount
+            bucket.count += 1
+            bucket.save()
+
+    @staticmethod
+    def remove(transaction_id, amount, category_name, is_income, date):
+        encrypted_category = CryptoManager.encrypt_string(category_name)
+
+        with db.atomic():
+            SpendingAlert.delete().where(SpendingAlert.transaction == transaction_id).execute()
+
+            stat = CategoryStatistic.get_or_none(
+                (CategoryStatistic.category_name == encrypted_category) &
+                (CategoryStatistic.is_income == is_income)
+            )
+            if stat:
+                if stat.count <= 1:
+                    stat.delete_instance()
+                else:
+                    # Welford's update run backwards.
+                    old_mean = stat.mean
+                    stat.count -= 1
+                    stat.mean = (old_mean * (stat.count + 1) - amount) / stat.count
+                    stat.m2 = max(stat.m2 - (amount - stat.mean) * (amount - old_mean), 0.0)
+                    stat.save()
+
+            bucket = CategoryMonthlyTotal.get_or_none(
+                (CategoryMonthlyTotal.category_name == encrypted_category) &
+                (CategoryMonthlyTotal.is_income == is_income) &
+                (CategoryMonthlyTotal.month == StatisticsStore._month_key(date))
+            )
+            if bucket:
+                if bucket.count <= 1:
+                    bucket.delete_instance()
+                else:
+                    bucket.total -= amount
+                    bucket.count -= 1
+                    bucket.save()
+
+    @staticmethod
+    def _z_score(stat, amount):
+        if stat.count < StatisticsStore.MIN_SAMPLES:
+            return None
+
+        std = math.sqrt(stat.m2 / (stat.count - 1))
+        if std == 0:
+            return None
+        return (amount - stat.mean) / std
+
+    @staticmethod
+    def get_statistics(category_name, is_income=False):
+        stat = CategoryStatistic.get_or_none(
+            (CategoryStatistic.category_name == CryptoManager.encrypt_string(category_name)) &
+            (CategoryStatistic.is_income == is_income)
+        )
+        if not stat:
+            return {"count": 0, "mean": 0.0, "std": 0.0}
+
+        std = math.sqrt(stat.m2 / (stat.count - 1)) if stat.count > 1 else 0.0
+        return {"count": stat.count, "mean": stat.mean, "std": std}
+
+    @staticmethod
+    def window_total(category_name, is_income=False, months=3):
+        current_month = datetime.now().replace(day=1)
+        month_keys = [StatisticsStore._month_key(current_month - relativedelta(months=i)) for i in range(months)]
+
+        total = (CategoryMonthlyTotal
+                 .select(fn.COALESCE(fn.SUM(CategoryMonthlyTotal.total), 0))
+                 .where(
+                     (CategoryMonthlyTotal.category_name == CryptoManager.encrypt_string(category_name)) &
+                     (CategoryMonthlyTotal.is_income == is_income) &
+                     (CategoryMonthlyTotal.month.in_(month_keys))
+                 )
+                 .scalar())
+        return total
+
+    @staticmethod
+    def rebuild():
+        # Replays the whole history in memory and writes the results in bulk, instead of
+        # running record() once per transaction.
+        stats = {}
+        buckets = {}
+        alerts = []
+
+        rows = list(Transaction
+                    .select(Transaction.id, fn.DATE(Transaction.date).coerce(False), Transaction.amount,
+                            Transaction.category_name, Transaction.is_income, Transaction.currency, Transaction.key_id)
+                    .order_by(Transaction.date, Transaction.id)
+                    .tuples())
+
+        # Statistics are kept in the base currency; conversion runs over the whole history at once.
+        amounts = CurrencyConverter.convert(
+            [CryptoManager.decrypt_number(row[2], row[6]) for row in rows],
+            [row[5] for row in rows],
+            [row[1] for row in rows]
+        )
+
+        # Category names are stored under the active key, whichever key each transaction uses.
+        categories = {}
+
+        for (transaction_id, iso_date, _, category_name, is_income, _, key_id), amount in zip(rows, amounts.tolist()):
+            is_income = bool(is_income)
+            if (category_name, key_id) not in categories:
+                categories[category_name, key_id] = CryptoManager.encrypt_string(
+                    CryptoManager.decrypt_string(category_name, key_id))
+            category_name = categories[category_name, key_id]
+
+            stat = stats.setdefault((category_name, is_income), CategoryStatistic(
+                category_name=category_name, is_income=is_income, count=0, mean=0.0, m2=0.0))
+
+            z_score = StatisticsStore._z_score(stat, amount)
+            if not is_income and z_score is not None and z_score >= StatisticsStore.ALERT_THRESHOLD:
+                alerts.append({"transaction": transaction_id, "category_name": category_name,
+                               "z_score": z_score, "mean": stat.mean, "date": iso_date})
+
+            stat.count += 1
+            delta = amount - stat.mean
+            stat.mean += delta / stat.count
+            stat.m2 += delta * (amount - stat.mean)
+
+            bucket = buckets.setdefault((category_name, is_income, iso_date[:7]), [0.0, 0])
+            bucket[0] += amount
+            bucket[1] += 1
+
+        with db.atomic():
+            SpendingAlert.delete().execute()
+            CategoryStatistic.delete().execute()
+            CategoryMonthlyTotal.delete().execute()
+
+            CategoryStatistic.bulk_create(list(stats.values()), batch_size=500)
+            CategoryMonthlyTotal.bulk_create([
+                CategoryMonthlyTotal(category_name=category_name, is_income=is_income, month=month, total=total, count=count)
+                for (category_name, is_income, month), (total, count) in buckets.items()
+            ], batch_size=500)
+            for start in range(0, len(alerts), 500):
+                SpendingAlert.insert_many(alerts[start:start + 500]).execute()
@@ -1,32 +1,131 @@
+import csv
+import gzip
 from datetime import datetime
+from database.db import db
 from database.models import Transaction
+from core.statistics import StatisticsStore
+from core.currency import CurrencyConverter
+from core.duplicates import DuplicateDetector
 from utils.crypto import CryptoManager
 
 
 class TransactionManager:
     @staticmethod
-    def add_transaction(amount, category_name, description="", is_income=False, date=None):
-        transaction = Transaction.create(
-            amount=CryptoManager.encrypt_number(amount),
-            category_name=CryptoManager.encrypt_string(category_name),
-            description=CryptoManager.encrypt_string(description) if description else "",
-            is_income=is_income,
-            date=datetime.now() if date is None else date
-        )
+    def add_transaction(amount, category_name, description="", is_income=False, date=None, currency=None,
+                        flag_duplicates=True):
+        # The returned transaction's duplicates lists the ids of stored transactions it may repeat,
+        # looked up in the fingerprint index before it was added. Callers that already checked
+        # pass flag_duplicates=False.
+        date = datetime.now() if date is None else date
+        currency = CurrencyConverter.base_currency() if currency is None else currency
+
+        duplicates = []
+        if flag_duplicates:
+            duplicates = DuplicateDetector.find_duplicates(amount, category_name, description, date, currency,
+                                                           window_days=DuplicateDetector.WINDOW_DAYS)
+        transaction = TransactionManager._insert(amount, category_name, description, is_income, date, currency)
+        transaction.duplicates = duplicates
         return transaction
 
+    @staticmethod
+    def _insert(amount, category_name, description, is_income, date, currency):
+        key_id = CryptoManager.active_key_id()
+
+        with db.atomic():
+            transaction = Transaction.create(
+                amount=CryptoManager.encrypt_number(amount, key_id),
+                category_name=CryptoManager.encrypt_string(category_name, key_id),
+                description=CryptoManager.encrypt_string(description, key_id) if description else "",
+                is_income=is_income,
+                date=date,
+                currency=currency,
+                key_id=key_id
+            )
+            StatisticsStore.record(
+                transaction.id, CurrencyConverter.convert_one(amount, currency, date), category_name, is_income, date
+            )
+            DuplicateDetector.index(transaction.id, amount, category_name, description, date, currency)
+        return transaction
+
+    @staticmethod
+    def add_transactions(transactions, skip_duplicates=True):
+        # transactions are dicts of add_transaction() arguments. Duplicates of stored rows are
+        # found with one fingerprint lookup for the whole batch, repeats within the batch with a set.
+        base_currency = CurrencyConverter.base_currency()
+        rows = [(t["amount"], t["category_name"], t.get("description", ""), t["date"], t.get("currency") or base_currency)
+                for t in transactions]
+        matches = DuplicateDetector.flag_batch(rows) if skip_duplicates else [[] for _ in rows]
+
+        added, skipped = 0, 0
+        seen = set()
+        with db.atomic():
+            for transaction, row, row_matches in zip(transactions, rows, matches):
+                fingerprint = DuplicateDetector.fingerprints(*row)[0]
+                if skip_duplicates and (row_matches or fingerprint in seen):
+                    skipped += 1
+                    continue
+
+                seen.add(fingerprint)
+                amount, category_name, description, date, currency = row
+                TransactionManager._insert(amount, category_name, description,
+                                           transaction.get("is_income", False), date, currency)
+                added += 1
+        return added, skipped
+
+    @staticmethod
+    def import_csv(file_path):
+        # Reads the layout written by the CSV export, optionally gzip-compressed.
+        opener = gzip.open if file_path.endswith(".gz") else open
+        try:
+            with opener(file_path, "rt", newline="", encoding="utf-8") as file:
+                transactions = [{
+                    "amount": float(row["Amount"]),
+                    "category_name": row["Category"].strip(),
+                    "description": row.get("Description", "").strip(),
+                    "is_income": row["Type"].strip().lower() == "income",
+                    "date": datetime.strptime(row["Date"].strip(), "%Y-%m-%d").date(),
+                    "currency": (row.get("Currency") or "").strip().upper() or None
+                } for row in csv.DictReader(file)]
+        except FileNotFoundError:
+            return False, f"Error: The file '{file_path}' does not exist."
+        except (KeyError, ValueError, OSError):
+            return False, "Error: The file must have Date (YYYY-MM-DD), Category, Amount and Type columns."
+
+        if not transactions:
+            return False, "No transactions found in the file"
+
+        unknown = {t["currency"] for t in transactions if t["currency"] and not CurrencyConverter.has_rates(t["currency"])}
+        if unknown:
+            return False, f"No exchange rates for {', '.join(sorted(unknown))}. Import them first."
+
+        added, skipped = TransactionManager.add_transactions(transactions)
+        return True, f"Imported {added} transactions, skipped {skipped} duplicates"
+
     @staticmethod
     def delete_transaction(transaction_id):
         transaction = Transaction.get_or_none(Transaction.id == transaction_id)
         if transaction:
-            transaction.delete_instance()
+            with db.atomic():
+                StatisticsStore.remove(
+                    transaction.id,
+                    CurrencyConverter.convert_one(
+                        CryptoManager.decrypt_number(transaction.amount, transaction.key_id),
+                        transaction.currency,
+                        transaction.date
+                    ),
+                    CryptoManager.decrypt_string(transaction.category_name, transaction.key_id),
+                    transaction.is_income,
+                    transaction.date
+                )
+                DuplicateDetector.unindex(transaction.id)
+                transaction.delete_instance()
             return True
         return False
 
     @staticmethod
     def get_all_categories():
-        transactions = Transaction.select()
+        transactions = Transaction.select(Transaction.category_name, Transaction.key_id).distinct()
         categories = set()
         for t in transactions:
-            categories.add(CryptoManager.decrypt_string(t.category_name))
+            categories.add(CryptoManager.decrypt_string(t.category_name, t.key_id))
         return list(categories)
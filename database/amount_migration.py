@@ -0,0 +1,120 @@
+import sys
+from peewee import IntegerField
+from playhouse.migrate import SqliteMigrator, migrate
+from database.db import db
+
+TABLES = ("transaction", "recurringrule")
+
+
+def _amount_type(table):
+    return next(column.data_type.upper() for column in db.get_columns(table) if column.name == "amount")
+
+
+def _scopes(table, keys, active_key_id):
+    # (key id, WHERE clause, parameters) for every key the table's amounts may be encrypted with.
+    if table == "transaction":
+        return [(key_id, "WHERE key_id = ?", [key_id]) for key_id in keys]
+    return [(active_key_id, "", [])]
+
+
+def _legacy_amounts(table, keys, active_key_id):
+    # Every row's amount read the way the app read it before this migration: (ciphertext - b) / a
+    # on the float column, keyed by row id along with the group it is reported under.
+    amounts = {}
+    for key_id, where, params in _scopes(table, keys, active_key_id):
+        a, b, _ = keys[key_id]
+        for row_id, amount, category_name, is_income, currency in db.execute_sql(
+                f'SELECT id, amount, category_name, is_income, currency FROM "{table}" {where}', params):
+            amounts[row_id] = ((table, key_id, category_name, is_income, currency), (amount - b) / a)
+    return amounts
+
+
+def validate_amounts(table, before, active_key_id):
+    # The migrated amounts are read back through CryptoManager, the same path the app reads them
+    # with, rather than with the conversion's own SQL. Each one must be its old amount rounded to cents.
+    from utils.crypto import CryptoManager
+
+    key_column = "key_id" if table == "transaction" else "NULL"
+    after = {row_id: CryptoManager.decrypt_number(amount, key_id or active_key_id)
+             for row_id, amount, key_id in db.execute_sql(f'SELECT id, amount, {key_column} FROM "{table}"')}
+
+    groups = {}
+    for row_id, (group, old_amount) in before.items():
+        new_amount = after.pop(row_id, None)
+        totals = groups.setdefault(group, {"count": 0, "old_total": 0.0, "new_total": 0.0, "matches": True})
+        totals["count"] += 1
+        totals["old_total"] += old_amount
+        if new_amount is None or abs(new_amount - old_amount) > 0.005 + 1e-9 * abs(old_amount):
+            totals["matches"] = False
+        else:
+            totals["new_total"] += new_amount
+
+    report = [{
+        "table": table,
+        "category": CryptoManager.decrypt_string(category_name, key_id),
+        "is_income": bool(is_income),
+        "currency": currency,
+        **totals
+    } for (_, key_id, category_name, is_income, currency), totals in groups.items()]
+
+    if after:
+        report.append({"table": table, "category": None, "is_income": False, "currency": "", "count": len(after),
+                       "old_total": 0.0, "new_total": None, "matches": False})
+    return report
+
+
+def migrate_amounts_to_cents():
+    tables = [table for table in TABLES if _amount_type(table) == "REAL"]
+    if not tables:
+        return None
+
+    # The keys in use belong to the database being migrated, which may have just replaced
+    # another one in a restore.
+    from utils.crypto import CryptoManager
+    CryptoManager.reload()
+    keys = CryptoManager.key_material()
+    active_key_id = CryptoManager.active_key_id()
+    migrator = SqliteMigrator(db)
+
+    # One transaction for the whole switch: the app either sees the old float column or the
+    # new integer column with amounts that passed validation.
+    with db.atomic():
+        before = {table: _legacy_amounts(table, keys, active_key_id) for table in tables}
+
+        for table in tables:
+            migrate(migrator.add_column(table, "amount_cents", IntegerField(default=0)))
+            for key_id, where, params in _scopes(table, keys, active_key_id):
+                a, b, _ = keys[key_id]
+                db.execute_sql(
+                    f'UPDATE "{table}" SET amount_cents = ? * CAST(ROUND((amount - ?) * 100.0 / ?) AS INTEGER) + ? {where}',
+                    [a, b, a, b] + params
+                )
+            migrate(migrator.drop_column(table, "amount"), migrator.rename_column(table, "amount_cents", "amount"))
+
+        report = []
+        for table in tables:
+            report.extend(validate_amounts(table, before[table], active_key_id))
+        if not all(row["matches"] for row in report):
+            raise ValueError("Migrated amounts do not match the original amounts: "
+                             f"{[row for row in report if not row['matches']]}")
+
+    # Older snapshots still hold float amounts, so the next backup must not be a delta on top of them.
+    from utils.backup import BackupManager
+    BackupManager.require_full_snapshot()
+    return report
+
+
+if __name__ == "__main__":
+    # python -m database.amount_migration [database file]: migrates a database and prints the check.
+    from database.db import upgrade_schema
+
+    if len(sys.argv) > 1:
+        db.init(sys.argv[1])
+    db.connect()
+    report = upgrade_schema()
+    if report is None:
+        print("Amounts are already stored as integer cents")
+    else:
+        for row in report:
+            print(f"{row['table']:<14} {row['category']!s:<16} {row['currency']:<4} {row['count']:>8} "
+                  f"{row['old_total']:>16.4f} {row['new_total'] or 0:>16.2f} {'ok' if row['matches'] else 'MISMATCH'}")
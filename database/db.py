@@ -1,11 +1,99 @@
 from peewee import *
+from playhouse.migrate import SqliteMigrator, migrate
 
 db = SqliteDatabase("finance_tracker.db")
 
+JOURNAL_TABLE = "changejournal"
+# Tables computed from the transactions. They are rebuilt after a restore instead of being
+# journaled, so a rebuild does not turn the next delta backup into a copy of the whole table.
+DERIVED_TABLES = ("categorystatistic", "categorymonthlytotal", "spendingalert", "transactionfingerprint")
+
+
 def setup_database():
-    from database.models import Transaction, Settings
+    # Returns the amount migration's report when this start converted the database, else None.
+    from database.models import Settings
     db.connect()
-    db.create_tables(models=[Transaction, Settings], safe=True)
+    report = upgrade_schema()
 
     if Settings.select().count() == 0:
         Settings.create(theme="Light")
+
+    rebuild_derived_tables()
+    return report
+
+
+def rebuild_derived_tables(force=False):
+    # Statistics and fingerprints are derived from the transactions. They are rebuilt when forced, as
+    # after a restore, for a database from an older version, or when the fingerprints were made with another key.
+    from database.models import Transaction, CategoryStatistic
+    from core.statistics import StatisticsStore
+    from core.duplicates import DuplicateDetector
+    from utils.backup import BackupManager
+
+    if force or (CategoryStatistic.select().count() == 0 and Transaction.select().count() > 0):
+        StatisticsStore.rebuild()
+
+    if force or not DuplicateDetector.is_current():
+        DuplicateDetector.rebuild()
+
+    # Users who never back up would otherwise keep every journal entry ever written.
+    BackupManager.prune_journal()
+
+
+def upgrade_schema():
+    # Brings any database, including one just restored from an older snapshot, up to the current schema.
+    from database.models import (Transaction, Settings, CategoryStatistic, CategoryMonthlyTotal, SpendingAlert,
+                                 RecurringRule, ChangeJournal, ExchangeRate, TransactionFingerprint,
+                                 KeyRotation)
+    from database.amount_migration import migrate_amounts_to_cents
+
+    models = [Transaction, Settings, CategoryStatistic, CategoryMonthlyTotal, SpendingAlert, RecurringRule,
+              ChangeJournal, ExchangeRate, TransactionFingerprint, KeyRotation]
+    db.create_tables(models=models, safe=True)
+    add_missing_columns(models)
+    report = migrate_amounts_to_cents()
+    # Last, because the migration rebuilds tables and SQLite drops a table's triggers with it.
+    create_change_triggers()
+    return report
+
+
+def add_missing_columns(models):
+    # Columns added to a model after its table was first created are added in place,
+    # so databases from older versions keep working.
+    migrator = SqliteMigrator(db)
+    operations = []
+    for model in models:
+        existing = {column.name for column in db.get_columns(model._meta.table_name)}
+        for field in model._meta.sorted_fields:
+            if field.column_name not in existing:
+                operations.append(migrator.add_column(model._meta.table_name, field.column_name, field))
+
+    if operations:
+        with db.atomic():
+            migrate(*operations)
+
+
+def create_change_triggers():
+    # Every write to a user table leaves a (table, row id) entry in the journal,
+    # so incremental backups only need to copy the rows listed there.
+    for table in db.get_tables():
+        if table == JOURNAL_TABLE or table.startswith("sqlite_"):
+            continue
+
+        for operation, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            if table in DERIVED_TABLES:
+                # Databases from earlier versions journaled these too.
+                db.execute_sql(f'DROP TRIGGER IF EXISTS "{table}_journal_{operation.lower()}"')
+                continue
+            db.execute_sql(
+                f'CREATE TRIGGER IF NOT EXISTS "{table}_journal_{operation.lower()}" '
+                f'AFTER {operation} ON "{table}" BEGIN '
+                f'INSERT INTO "{JOURNAL_TABLE}" (table_name, row_id, operation) '
+                f"VALUES ('{table}', {row}.id, '{operation}'); END"
+            )
+
+
+def get_data_version():
+    # The journal id only ever grows, across restores too, so it doubles as a persistent version
+    # stamp for the data.
+    return db.execute_sql(f'SELECT COALESCE(MAX(id), 0) FROM "{JOURNAL_TABLE}"').fetchone()[0]
@@ -10,13 +10,107 @@ class BaseModel(Model):
 
 class Transaction(BaseModel):
     id = AutoField()
-    amount = FloatField() 
+    amount = IntegerField()
     description = CharField(null=True)
     category_name = CharField()
-    date = DateField(default=datetime.now().date())
+    date = DateField(default=datetime.now().date(), index=True)
     is_income = BooleanField(default=False)
+    currency = CharField(default="USD")
+    key_id = IntegerField(default=1)
+
+    class Meta:
+        indexes = ((("category_name", "date"), False),)
 
 
 class Settings(BaseModel):
     id = AutoField()
     theme = CharField(default="Light")
+    history_page_size = IntegerField(default=50)
+    trend_months = IntegerField(default=6)
+    forecast_months = IntegerField(default=6)
+    base_currency = CharField(default="USD")
+    export_format = CharField(default="CSV")
+    cache_limit = IntegerField(default=32)
+
+
+class CategoryStatistic(BaseModel):
+    id = AutoField()
+    category_name = CharField()
+    is_income = BooleanField(default=False)
+    count = IntegerField(default=0)
+    mean = FloatField(default=0.0)
+    m2 = FloatField(default=0.0)
+
+    class Meta:
+        indexes = ((("category_name", "is_income"), True),)
+
+
+class CategoryMonthlyTotal(BaseModel):
+    id = AutoField()
+    category_name = CharField()
+    is_income = BooleanField(default=False)
+    month = CharField()
+    total = FloatField(default=0.0)
+    count = IntegerField(default=0)
+
+    class Meta:
+        indexes = ((("category_name", "is_income", "month"), True),)
+
+
+class SpendingAlert(BaseModel):
+    id = AutoField()
+    transaction = ForeignKeyField(Transaction, backref="alerts", on_delete="CASCADE")
+    category_name = CharField()
+    z_score = FloatField()
+    mean = FloatField()
+    date = DateField(index=True)
+
+
+class RecurringRule(BaseModel):
+    id = AutoField()
+    amount = IntegerField()
+    description = CharField(null=True)
+    category_name = CharField()
+    is_income = BooleanField(default=False)
+    start_date = DateField()
+    end_date = DateField(null=True)
+    interval_unit = CharField(default="month")
+    interval_count = IntegerField(default=1)
+    currency = CharField(default="USD")
+
+
+class ChangeJournal(BaseModel):
+    id = AutoField()
+    table_name = CharField()
+    row_id = IntegerField()
+    operation = CharField()
+
+
+class ExchangeRate(BaseModel):
+    id = AutoField()
+    currency = CharField()
+    date = DateField()
+    rate = FloatField()
+
+    class Meta:
+        indexes = ((("currency", "date"), True),)
+
+
+class TransactionFingerprint(BaseModel):
+    id = AutoField()
+    transaction = ForeignKeyField(Transaction, backref="fingerprints", on_delete="CASCADE", unique=True)
+    fingerprint = CharField(index=True)
+    loose_fingerprint = CharField()
+    date = DateField()
+
+    class Meta:
+        indexes = ((("loose_fingerprint", "date"), False),)
+
+
+class KeyRotation(BaseModel):
+    id = AutoField()
+    source_key_id = IntegerField()
+    target_key_id = IntegerField()
+    last_id = IntegerField(default=0)
+    started = DateTimeField(default=datetime.now)
+    finished = DateTimeField(null=True)
@@ -2,7 +2,8 @@ import customtkinter as ctk
 from ui.dashboard import DashboardFrame
 from ui.transaction_panel import TransactionPanel
 from ui.settings_panel import SettingsPanel
-from database.models import Settings
+from core.settings_store import SettingsStore
+from core.change_tracker import ChangeTracker
 
 
 class FinanceTrackerApp:
@@ -18,10 +19,13 @@ class FinanceTrackerApp:
         self.app.geometry("900x600")
         self.app.minsize(800, 500)
         
-        self.settings = Settings.select().first()
-        ctk.set_appearance_mode(self.settings.theme)
+        ctk.set_appearance_mode(SettingsStore.get("theme"))
+        SettingsStore.subscribe("theme", ctk.set_appearance_mode)
         
         self.setup_ui()
+
+        self.seen_generation = ChangeTracker.generation()
+        self.app.after(ChangeTracker.POLL_INTERVAL_MS, self.poll_changes)
     
     def setup_ui(self):
         self.app.grid_columnconfigure(0, weight=1)
@@ -57,12 +61,18 @@ class FinanceTrackerApp:
         self.dashboard.refresh_data()
     
     def refresh_all(self):
-        self.settings = Settings.select().first()
-        ctk.set_appearance_mode(self.settings.theme)
-        
         self.dashboard.refresh_data()
         self.transaction_panel.refresh_categories()
         self.transaction_panel.refresh_transactions()
     
+    def poll_changes(self):
+        # Picks up writes from other processes; each panel still skips work it has already done.
+        generation = ChangeTracker.generation()
+        if generation != self.seen_generation:
+            self.seen_generation = generation
+            self.refresh_all()
+        self.app.after(ChangeTracker.POLL_INTERVAL_MS, self.poll_changes)
+
     def run(self):
         self.app.mainloop()
+        self.dashboard.save_snapshot()
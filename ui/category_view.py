@@ -0,0 +1,75 @@
+import tkinter as tk
+from tkinter import ttk
+import customtkinter as ctk
+from core.category_detail import CategoryDetail
+from core.currency import CurrencyConverter
+from core.settings_store import SettingsStore
+from utils.charts import ChartGenerator
+
+
+class CategoryDetailWindow(ctk.CTkToplevel):
+    def __init__(self, parent, category_name, is_income=False):
+        super().__init__(parent)
+
+        self.category_name = category_name
+        self.is_income = is_income
+        self.next_page = 0
+
+        self.title(f"{category_name} Details")
+        self.geometry("700x600")
+
+        self.setup_chart()
+        self.setup_transaction_list()
+        self.load_next_page()
+
+    def setup_chart(self):
+        chart_frame = ctk.CTkFrame(self)
+        chart_frame.pack(fill="x", padx=10, pady=10)
+
+        series = CategoryDetail.monthly_series(self.category_name, self.is_income)
+        chart = ChartGenerator.create_category_chart(
+            series, chart_frame, theme=SettingsStore.get("theme"), title=f"{self.category_name} by Month"
+        )
+        chart.get_tk_widget().pack(fill="both", expand=True)
+
+    def setup_transaction_list(self):
+        list_frame = ctk.CTkFrame(self)
+        list_frame.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+
+        tree_frame = ctk.CTkFrame(list_frame)
+        tree_frame.pack(fill="both", expand=True, padx=10, pady=10)
+
+        columns = ("date", "description", "amount")
+        self.tree = ttk.Treeview(tree_frame, columns=columns, show="headings")
+
+        self.tree.heading("date", text="Date")
+        self.tree.heading("description", text="Description")
+        self.tree.heading("amount", text="Amount")
+
+        self.tree.column("date", width=100)
+        self.tree.column("description", width=300)
+        self.tree.column("amount", width=100)
+
+        scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscroll=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+
+        self.more_button = ctk.CTkButton(list_frame, text="Load More", command=self.load_next_page, fg_color="#607D8B")
+        self.more_button.pack(pady=(0, 10))
+
+    def load_next_page(self):
+        # Only the pages that are actually shown get read and decrypted.
+        records = CategoryDetail.get_page(self.category_name, self.next_page, self.is_income)
+        self.next_page += 1
+
+        base_currency = CurrencyConverter.base_currency()
+        for record in records:
+            if record.currency == base_currency:
+                amount = f"${record.amount:.2f}"
+            else:
+                amount = f"{record.amount:.2f} {record.currency}"
+            self.tree.insert("", "end", values=(record.date.strftime("%Y-%m-%d"), record.description or "", amount))
+
+        if len(records) < CategoryDetail.PAGE_SIZE:
+            self.more_button.configure(state="disabled", text="No More Transactions")
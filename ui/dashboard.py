@@ -1,20 +1,38 @@
+import threading
+from datetime import datetime
 import customtkinter as ctk
 from core.analytics import FinancialAnalytics
+from core.forecast import CashFlowForecaster
+from core.dashboard_snapshot import DashboardSnapshot
+from core.change_tracker import ChangeTracker
 from utils.charts import ChartGenerator
-from database.models import Settings
+from ui.category_view import CategoryDetailWindow
+from core.settings_store import SettingsStore
 
 
 class DashboardFrame(ctk.CTkFrame):
+    TREND_RANGES = {
+        "Monthly": ("month", None),
+        "Last 30 Days": ("day", 30),
+        "Last 12 Weeks": ("week", 12),
+        "Last 8 Quarters": ("quarter", 8),
+        "Last 5 Years": ("year", 5)
+    }
+
     def __init__(self, parent):
         super().__init__(parent)
 
         self.analytics = FinancialAnalytics()
-        self.settings = Settings.select().first()
 
         self.pie_chart = None
         self.line_chart = None
         self.bar_chart = None
 
+        self.stamp = None
+        self.data = None
+        self.rendered_key = None
+        self.trend_range = "Monthly"
+
         self.configure(fg_color="transparent")
 
         self.grid_columnconfigure(0, weight=1)
@@ -26,7 +44,8 @@ class DashboardFrame(ctk.CTkFrame):
         self.setup_summary_frame()
         self.setup_chart_frames()
 
-        self.refresh_data()
+        if not self.show_snapshot():
+            self.refresh_data()
 
     def setup_summary_frame(self):
         self.summary_frame = ctk.CTkFrame(self)
@@ -69,6 +88,19 @@ class DashboardFrame(ctk.CTkFrame):
         self.balance_value = ctk.CTkLabel(balance_frame, text="$0.00", font=ctk.CTkFont(size=24), text_color="#2196F3")
         self.balance_value.pack(pady=(0, 5))
 
+        self.alerts_label = ctk.CTkLabel(self.summary_frame, text="", text_color="#FF9800", justify="left")
+        self.alerts_label.pack(anchor="w", padx=25, pady=(0, 10))
+
+        range_frame = ctk.CTkFrame(self.summary_frame, fg_color="transparent")
+        range_frame.pack(fill="x", padx=25, pady=(0, 10))
+
+        range_label = ctk.CTkLabel(range_frame, text="TREND RANGE:", font=ctk.CTkFont(weight="bold"))
+        range_label.pack(side="left", padx=(0, 10))
+
+        self.range_var = ctk.StringVar(value=self.trend_range)
+        range_menu = ctk.CTkOptionMenu(range_frame, variable=self.range_var, values=list(self.TREND_RANGES), command=self.change_trend_range)
+        range_menu.pack(side="left")
+
     def setup_chart_frames(self):
         self.pie_frame = ctk.CTkFrame(self)
         self.pie_frame.grid(row=1, column=0, sticky="nsew", padx=10, pady=10)
@@ -97,32 +129,119 @@ class DashboardFrame(ctk.CTkFrame):
         self.bar_chart_frame = ctk.CTkFrame(self.bar_frame, fg_color="transparent")
         self.bar_chart_frame.pack(fill="both", expand=True, padx=10, pady=10)
 
-    def refresh_data(self):
-        try:
-            self.settings = Settings.select().first()
-            
-            balance_data = self.analytics.get_monthly_balance()
+    def change_trend_range(self, trend_range):
+        self.trend_range = trend_range
+        self.refresh_data()
 
-            self.income_value.configure(text=f"${balance_data["income"]:.2f}")
-            self.expenses_value.configure(text=f"${balance_data["expenses"]:.2f}")
+    def refresh_key(self):
+        # Settings are written through the database, so the generation covers them as well.
+        return ChangeTracker.generation(), datetime.now().date(), self.trend_range
 
-            balance_amount = balance_data["balance"]
-            if balance_amount >= 0:
-                balance_color = "#4CAF50"
-            else:
-                balance_color = "#F44336"
-                
-            self.balance_value.configure(text=f"${balance_amount:.2f}", text_color=balance_color)
+    def current_stamp(self):
+        return dict(DashboardSnapshot.current_stamp(), trend_range=self.trend_range)
 
-            expense_data = self.analytics.get_expense_breakdown()
-            trend_data = self.analytics.get_monthly_trend()
+    def load_data(self):
+        granularity, periods = self.TREND_RANGES[self.trend_range]
+        if periods is None:
+            periods = SettingsStore.get("trend_months")
 
-            self.update_charts(expense_data, trend_data)
-            
+        return {
+            "balance": self.analytics.get_monthly_balance(),
+            "alerts": self.analytics.get_spending_alerts(),
+            "expenses": self.analytics.get_expense_breakdown(),
+            "trend": self.analytics.get_trend(granularity, periods),
+            "forecast": CashFlowForecaster.forecast(SettingsStore.get("forecast_months")) if granularity == "month" else None
+        }
+
+    def refresh_data(self, force=False):
+        key = self.refresh_key()
+        if not force and key == self.rendered_key:
+            return
+
+        try:
+            self.stamp = self.current_stamp()
+            self.render(self.load_data())
+            self.rendered_key = key
         except:
             print(f"Error refreshing data")
 
-    def update_charts(self, expense_data, trend_data):
+    def render(self, data):
+        self.data = data
+
+        balance_data = data["balance"]
+
+        self.income_value.configure(text=f"${balance_data["income"]:.2f}")
+        self.expenses_value.configure(text=f"${balance_data["expenses"]:.2f}")
+
+        balance_amount = balance_data["balance"]
+        if balance_amount >= 0:
+            balance_color = "#4CAF50"
+        else:
+            balance_color = "#F44336"
+
+        self.balance_value.configure(text=f"${balance_amount:.2f}", text_color=balance_color)
+
+        alert_lines = [
+            f"Unusual spending: {alert['category']} ${alert['amount']:.2f} on {alert['date']:%Y-%m-%d} "
+            f"is {alert['z_score']:.1f}σ above your norm of ${alert['mean']:.2f}"
+            for alert in data["alerts"]
+        ]
+        self.alerts_label.configure(text="\n".join(alert_lines))
+
+        self.update_charts(data["expenses"], data["trend"], data.get("forecast"))
+
+    def show_snapshot(self):
+        stamp, data = DashboardSnapshot.load()
+        if data is None:
+            return False
+
+        try:
+            self.stamp = stamp
+            self.render(data)
+        except:
+            return False
+
+        self.revalidate()
+        return True
+
+    def revalidate(self):
+        # The stamp check and any reload run off the UI thread; the result is picked up by polling.
+        expected_stamp = self.stamp
+        result = {}
+        # Whatever the check finds is rendered below, so later refreshes can compare against now.
+        self.rendered_key = self.refresh_key()
+
+        def check():
+            stamp = self.current_stamp()
+            if stamp != expected_stamp:
+                result["data"] = self.load_data()
+            result["stamp"] = stamp
+
+        worker = threading.Thread(target=check, daemon=True)
+        worker.start()
+        self.after(50, self._finish_revalidation, worker, expected_stamp, result)
+
+    def _finish_revalidation(self, worker, expected_stamp, result):
+        if worker.is_alive():
+            self.after(50, self._finish_revalidation, worker, expected_stamp, result)
+            return
+
+        # A refresh that happened in the meantime already shows newer data.
+        if "data" in result and self.stamp == expected_stamp:
+            self.stamp = result["stamp"]
+            try:
+                self.render(result["data"])
+            except:
+                print(f"Error refreshing data")
+
+    def save_snapshot(self):
+        if self.data is not None:
+            DashboardSnapshot.save(self.stamp, self.data)
+
+    def open_category(self, category_name):
+        CategoryDetailWindow(self, category_name)
+
+    def update_charts(self, expense_data, trend_data, forecast_data=None):
         try:
             for widget in self.pie_chart_frame.winfo_children():
                 widget.destroy()
@@ -135,13 +254,14 @@ class DashboardFrame(ctk.CTkFrame):
 
             chart_generator = ChartGenerator()
             
-            current_theme = self.settings.theme
+            current_theme = SettingsStore.get("theme")
             
-            self.pie_chart = chart_generator.create_pie_chart(expense_data, self.pie_chart_frame, theme=current_theme)
+            self.pie_chart = chart_generator.create_pie_chart(expense_data, self.pie_chart_frame, theme=current_theme,
+                                                              on_select=self.open_category)
             if self.pie_chart:
                 self.pie_chart.get_tk_widget().pack(fill="both", expand=True)
 
-            self.line_chart = chart_generator.create_line_chart(trend_data, self.line_chart_frame, theme=current_theme)
+            self.line_chart = chart_generator.create_line_chart(trend_data, self.line_chart_frame, theme=current_theme, forecast=forecast_data)
             if self.line_chart:
                 self.line_chart.get_tk_widget().pack(fill="both", expand=True)
 
@@ -1,15 +1,22 @@
+import threading
+from itertools import chain
 import customtkinter as ctk
 from tkinter import messagebox, filedialog
-from database.models import Settings
+from core.settings_store import SettingsStore
 from core.analytics import FinancialAnalytics
-from utils.export_data import export_transactions
+from core.currency import CurrencyConverter
+from core.transaction_manager import TransactionManager
+from utils.export_data import export_transactions, available_formats, EXPORT_FORMATS
+from core.key_rotation import KeyRotationManager
+from core.change_tracker import ChangeTracker
+from utils.backup import BackupManager
+from utils.crypto import CryptoManager
 
 
 class SettingsPanel(ctk.CTkFrame):
     def __init__(self, parent, refresh_callback=None):
         super().__init__(parent)
 
-        self.settings = Settings.select().first()
         self.refresh_callback = refresh_callback
         self.analytics = FinancialAnalytics()
 
@@ -20,6 +27,11 @@ class SettingsPanel(ctk.CTkFrame):
 
         self.setup_settings_panel()
 
+        SettingsStore.subscribe("theme", self.show_theme)
+        SettingsStore.subscribe("history_page_size", lambda value: self.page_size_var.set(str(value)))
+        SettingsStore.subscribe("trend_months", lambda value: self.trend_months_var.set(str(value)))
+        SettingsStore.subscribe("forecast_months", lambda value: self.forecast_months_var.set(str(value)))
+
     def setup_settings_panel(self):
         main_frame = ctk.CTkFrame(self)
         main_frame.grid(row=0, column=0, sticky="nsew", padx=20, pady=20)
@@ -36,73 +48,344 @@ class SettingsPanel(ctk.CTkFrame):
         theme_hint = ctk.CTkLabel(theme_frame, text="Toggle between Light and Dark theme", text_color="#9E9E9E")
         theme_hint.pack(anchor="w", padx=15, pady=(0, 10))
 
-        self.current_theme_label = ctk.CTkLabel(theme_frame, text=f"Current Theme: {self.settings.theme}")
+        self.current_theme_label = ctk.CTkLabel(theme_frame, text=f"Current Theme: {SettingsStore.get("theme")}")
         self.current_theme_label.pack(anchor="w", padx=15, pady=(0, 10))
 
-        self.theme_var = ctk.StringVar(value=self.settings.theme)
+        self.theme_var = ctk.StringVar(value=SettingsStore.get("theme"))
 
         theme_button = ctk.CTkButton(theme_frame, text="Toggle Theme", command=self.toggle_theme)
         theme_button.pack(fill="x", padx=15, pady=(0, 15))
 
+        performance_frame = ctk.CTkFrame(main_frame)
+        performance_frame.pack(fill="x", pady=10)
+
+        performance_label = ctk.CTkLabel(performance_frame, text="Performance", font=ctk.CTkFont(size=16, weight="bold"))
+        performance_label.pack(anchor="w", padx=15, pady=(10, 5))
+
+        page_size_hint = ctk.CTkLabel(performance_frame, text="Transactions shown in the history list", text_color="#9E9E9E")
+        page_size_hint.pack(anchor="w", padx=15, pady=(0, 5))
+
+        self.page_size_var = ctk.StringVar(value=str(SettingsStore.get("history_page_size")))
+        page_size_menu = ctk.CTkOptionMenu(performance_frame, variable=self.page_size_var, values=["50", "100", "250", "500"],
+                                           command=lambda value: self.change_setting("history_page_size", int(value)))
+        page_size_menu.pack(fill="x", padx=15, pady=(0, 10))
+
+        trend_hint = ctk.CTkLabel(performance_frame, text="Months shown in the dashboard trend charts", text_color="#9E9E9E")
+        trend_hint.pack(anchor="w", padx=15, pady=(0, 5))
+
+        self.trend_months_var = ctk.StringVar(value=str(SettingsStore.get("trend_months")))
+        trend_menu = ctk.CTkOptionMenu(performance_frame, variable=self.trend_months_var, values=["3", "6", "12"],
+                                       command=lambda value: self.change_setting("trend_months", int(value)))
+        trend_menu.pack(fill="x", padx=15, pady=(0, 10))
+
+        forecast_hint = ctk.CTkLabel(performance_frame, text="Months of projected balance shown after the monthly trend", text_color="#9E9E9E")
+        forecast_hint.pack(anchor="w", padx=15, pady=(0, 5))
+
+        self.forecast_months_var = ctk.StringVar(value=str(SettingsStore.get("forecast_months")))
+        forecast_menu = ctk.CTkOptionMenu(performance_frame, variable=self.forecast_months_var, values=["3", "6", "12"],
+                                          command=lambda value: self.change_setting("forecast_months", int(value)))
+        forecast_menu.pack(fill="x", padx=15, pady=(0, 15))
+
+        currency_frame = ctk.CTkFrame(main_frame)
+        currency_frame.pack(fill="x", pady=10)
+
+        currency_label = ctk.CTkLabel(currency_frame, text="Currencies", font=ctk.CTkFont(size=16, weight="bold"))
+        currency_label.pack(anchor="w", padx=15, pady=(10, 5))
+
+        currency_hint = ctk.CTkLabel(currency_frame, text="Import a CSV of exchange rates with date, currency and rate columns", text_color="#9E9E9E")
+        currency_hint.pack(anchor="w", padx=15, pady=(0, 10))
+
+        base_currency_label = ctk.CTkLabel(currency_frame, text=f"Base Currency: {CurrencyConverter.base_currency()}")
+        base_currency_label.pack(anchor="w", padx=15, pady=(0, 10))
+
+        rates_button = ctk.CTkButton(currency_frame, text="Import Exchange Rates", command=self.import_exchange_rates)
+        rates_button.pack(fill="x", padx=15, pady=(0, 15))
+
         export_frame = ctk.CTkFrame(main_frame)
         export_frame.pack(fill="x", pady=10)
 
         export_label = ctk.CTkLabel(export_frame, text="Data Export", font=ctk.CTkFont(size=16, weight="bold"))
         export_label.pack(anchor="w", padx=15, pady=(10, 5))
 
-        export_hint = ctk.CTkLabel(export_frame, text="Export all transactions to a CSV file", text_color="#9E9E9E")
+        export_hint = ctk.CTkLabel(export_frame, text="Export all transactions as CSV, compressed CSV, JSON Lines or a columnar file", text_color="#9E9E9E")
         export_hint.pack(anchor="w", padx=15, pady=(0, 10))
 
+        formats = available_formats()
+        export_format = SettingsStore.get("export_format")
+        self.export_format_var = ctk.StringVar(value=export_format if export_format in formats else formats[0])
+        export_format_menu = ctk.CTkOptionMenu(export_frame, variable=self.export_format_var, values=formats,
+                                               command=lambda value: SettingsStore.set("export_format", value))
+        export_format_menu.pack(fill="x", padx=15, pady=(0, 10))
+
         export_button = ctk.CTkButton(export_frame, text="Export Transactions", command=self.export_transactions, fg_color="#4CAF50")
-        export_button.pack(fill="x", padx=15, pady=(0, 15))
+        export_button.pack(fill="x", padx=15, pady=(0, 10))
+
+        import_button = ctk.CTkButton(export_frame, text="Import Transactions", command=self.import_transactions)
+        import_button.pack(fill="x", padx=15, pady=(0, 15))
+
+        backup_frame = ctk.CTkFrame(main_frame)
+        backup_frame.pack(fill="x", pady=10)
+
+        backup_label = ctk.CTkLabel(backup_frame, text="Backup & Restore", font=ctk.CTkFont(size=16, weight="bold"))
+        backup_label.pack(anchor="w", padx=15, pady=(10, 5))
+
+        backup_hint = ctk.CTkLabel(backup_frame, text="Snapshot the database while the app is running, or roll back to a snapshot", text_color="#9E9E9E")
+        backup_hint.pack(anchor="w", padx=15, pady=(0, 10))
+
+        self.backup_progress = ctk.CTkProgressBar(backup_frame)
+        self.backup_progress.set(0)
+        self.backup_progress.pack(fill="x", padx=15, pady=(0, 10))
+
+        self.backup_button = ctk.CTkButton(backup_frame, text="Create Backup", command=self.create_backup)
+        self.backup_button.pack(fill="x", padx=15, pady=(0, 10))
+
+        self.snapshot_var = ctk.StringVar(value="")
+        self.snapshot_menu = ctk.CTkOptionMenu(backup_frame, variable=self.snapshot_var, values=[""])
+        self.snapshot_menu.pack(fill="x", padx=15, pady=(0, 10))
+        self.refresh_snapshots()
+
+        self.restore_button = ctk.CTkButton(backup_frame, text="Restore Selected Backup", command=self.restore_backup, fg_color="#F44336")
+        self.restore_button.pack(fill="x", padx=15, pady=(0, 15))
+
+        security_frame = ctk.CTkFrame(main_frame)
+        security_frame.pack(fill="x", pady=10)
+
+        security_label = ctk.CTkLabel(security_frame, text="Security", font=ctk.CTkFont(size=16, weight="bold"))
+        security_label.pack(anchor="w", padx=15, pady=(10, 5))
+
+        security_hint = ctk.CTkLabel(security_frame, text="Re-encrypt all data with a new key; the app stays usable while it runs", text_color="#9E9E9E")
+        security_hint.pack(anchor="w", padx=15, pady=(0, 10))
+
+        self.rotation_status_label = ctk.CTkLabel(security_frame, text="")
+        self.rotation_status_label.pack(anchor="w", padx=15, pady=(0, 10))
+        self.show_rotation_status()
+
+        self.rotation_progress = ctk.CTkProgressBar(security_frame)
+        self.rotation_progress.set(0)
+        self.rotation_progress.pack(fill="x", padx=15, pady=(0, 10))
+
+        self.rotation_button = ctk.CTkButton(security_frame, text="Rotate Encryption Key", command=self.rotate_key)
+        self.rotation_button.pack(fill="x", padx=15, pady=(0, 15))
 
     def toggle_theme(self):
         new_theme = "Dark" if self.theme_var.get() == "Light" else "Light"
-        self.theme_var.set(new_theme)
-        ctk.set_appearance_mode(new_theme)
+        SettingsStore.set("theme", new_theme)
+
+        if self.refresh_callback:
+            self.refresh_callback()
+
+        messagebox.showinfo("Success", f"Theme changed to {new_theme}")
 
-        self.settings.theme = new_theme
-        self.settings.save()
+    def show_theme(self, theme):
+        self.theme_var.set(theme)
+        self.current_theme_label.configure(text=f"Current Theme: {theme}")
 
-        self.current_theme_label.configure(text=f"Current Theme: {new_theme}")
+    def change_setting(self, key, value):
+        SettingsStore.set(key, value)
 
         if self.refresh_callback:
             self.refresh_callback()
 
-        messagebox.showinfo("Success", f"Theme changed to {new_theme}")
+    def import_exchange_rates(self):
+        file_path = filedialog.askopenfilename(
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+            title="Import Exchange Rates"
+        )
 
-    def export_transactions(self):
-        df = self.analytics.get_transaction_history(limit=None) 
+        if not file_path:
+            return
 
-        if df.empty:
-            messagebox.showinfo("Export Transactions", "No transactions to export")
+        success, result = CurrencyConverter.import_rates_csv(file_path)
+
+        if success:
+            messagebox.showinfo("Import Successful", result)
+            if self.refresh_callback:
+                self.refresh_callback()
+        else:
+            messagebox.showerror("Import Failed", result)
+
+    def import_transactions(self):
+        file_path = filedialog.askopenfilename(
+            filetypes=[("CSV files", "*.csv *.csv.gz"), ("All files", "*.*")],
+            title="Import Transactions"
+        )
+
+        if not file_path:
             return
 
-        transactions = []
-        for _, row in df.iterrows():
-            date_str = row["date"].strftime("%Y-%m-%d")
+        success, result = TransactionManager.import_csv(file_path)
 
-            transaction = {
-                "Date": date_str,
-                "Category": row["category"],
-                "Description": row["description"] or "",
-                "Amount": f"{row["amount"]:.2f}",
-                "Type": "Income" if row["is_income"] else "Expense"
-            }
-            transactions.append(transaction)
+        if success:
+            messagebox.showinfo("Import Successful", result)
+            if self.refresh_callback:
+                self.refresh_callback()
+        else:
+            messagebox.showerror("Import Failed", result)
 
+    def export_transactions(self):
+        batches = self.analytics.iter_transaction_batches()
+        first_batch = next(batches, None)
+
+        if first_batch is None:
+            messagebox.showinfo("Export Transactions", "No transactions to export")
+            return
+
+        export_format = self.export_format_var.get()
+        extension = EXPORT_FORMATS[export_format]
         file_path = filedialog.asksaveasfilename(
-            defaultextension=".csv",
-            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+            defaultextension=extension,
+            filetypes=[(f"{export_format} files", f"*{extension}"), ("All files", "*.*")],
             title="Export Transactions"
         )
 
         if not file_path:  
             return
 
-        success, result = export_transactions(transactions, file_path)
+        rows = ([{
+            "Date": record.date,
+            "Category": record.category,
+            "Description": record.description or "",
+            "Amount": record.amount,
+            "Currency": record.currency,
+            "Type": "Income" if record.is_income else "Expense"
+        } for record in batch] for batch in chain([first_batch], batches))
+
+        success, result = export_transactions(rows, file_path, export_format)
 
         if success:
             messagebox.showinfo("Export Successful", f"Transactions exported to:\n{result}")
         else:
             messagebox.showerror("Export Failed", result)
+
+    def refresh_snapshots(self):
+        snapshots = [snapshot["file"] for snapshot in reversed(BackupManager.list_snapshots())]
+        self.snapshot_menu.configure(values=snapshots or [""])
+        self.snapshot_var.set(snapshots[0] if snapshots else "")
+
+    def create_backup(self):
+        self.backup_button.configure(state="disabled")
+        self.backup_progress.set(0)
+        self._backup_state = {"done": 0, "total": 1, "result": None}
+
+        def update_progress(done, total):
+            self._backup_state["done"], self._backup_state["total"] = done, total or 1
+
+        def run_backup():
+            # The poll below waits for a result, so the thread must leave one whatever goes wrong.
+            try:
+                result = BackupManager.create_snapshot(progress=update_progress)
+            except Exception as error:
+                result = (False, f"Backup failed: {error}")
+            self._backup_state["result"] = result
+
+        threading.Thread(target=run_backup, daemon=True).start()
+        self.after(100, self._poll_backup)
+
+    def _poll_backup(self):
+        self.backup_progress.set(self._backup_state["done"] / self._backup_state["total"])
+
+        if self._backup_state["result"] is None:
+            self.after(100, self._poll_backup)
+            return
+
+        self.backup_progress.set(1)
+        self.backup_button.configure(state="normal")
+        self.refresh_snapshots()
+
+        success, result = self._backup_state["result"]
+        if success:
+            messagebox.showinfo("Backup Successful", result)
+        else:
+            messagebox.showerror("Backup Failed", result)
+
+    def show_rotation_status(self):
+        if KeyRotationManager.pending_rotation():
+            self.rotation_status_label.configure(text="A key rotation was interrupted. Rotate again to resume it.", text_color="orange")
+        else:
+            self.rotation_status_label.configure(text=f"Current Key: {CryptoManager.active_key_id()}", text_color=("gray10", "gray90"))
+
+    def rotate_key(self):
+        self.rotation_button.configure(state="disabled")
+        self.rotation_progress.set(0)
+        self._rotation_state = {"done": 0, "total": 1, "result": None}
+
+        def update_progress(done, total):
+            self._rotation_state["done"], self._rotation_state["total"] = done, total or 1
+
+        def run_rotation():
+            try:
+                result = KeyRotationManager.rotate(progress=update_progress)
+            except Exception as error:
+                result = (False, f"Key rotation stopped: {error}. Rotate again to resume.")
+            self._rotation_state["result"] = result
+
+        threading.Thread(target=run_rotation, daemon=True).start()
+        self.after(100, self._poll_rotation)
+
+    def _poll_rotation(self):
+        self.rotation_progress.set(self._rotation_state["done"] / self._rotation_state["total"])
+
+        if self._rotation_state["result"] is None:
+            self.after(100, self._poll_rotation)
+            return
+
+        self.rotation_progress.set(1)
+        self.rotation_button.configure(state="normal")
+        self.show_rotation_status()
+
+        success, result = self._rotation_state["result"]
+        if success:
+            messagebox.showinfo("Key Rotation Complete", result)
+            if self.refresh_callback:
+                self.refresh_callback()
+        else:
+            messagebox.showerror("Key Rotation Stopped", result)
+
+    def restore_backup(self):
+        file_name = self.snapshot_var.get()
+        if not file_name:
+            messagebox.showinfo("Restore Backup", "No backups available")
+            return
+
+        if not messagebox.askyesno("Restore Backup", f"Replace all current data with the backup '{file_name}'?"):
+            return
+
+        self.backup_button.configure(state="disabled")
+        self.restore_button.configure(state="disabled")
+        self.backup_progress.set(0)
+        self._restore_state = {"done": 0, "total": 1, "result": None}
+
+        def update_progress(done, total):
+            self._restore_state["done"], self._restore_state["total"] = done, total or 1
+
+        def run_restore():
+            try:
+                result = BackupManager.restore_snapshot(file_name, progress=update_progress)
+            except Exception as error:
+                result = (False, f"Restore failed: {error}")
+            self._restore_state["result"] = result
+
+        threading.Thread(target=run_restore, daemon=True).start()
+        self.after(100, self._poll_restore)
+
+    def _poll_restore(self):
+        self.backup_progress.set(self._restore_state["done"] / self._restore_state["total"])
+
+        if self._restore_state["result"] is None:
+            self.after(100, self._poll_restore)
+            return
+
+        self.backup_progress.set(1)
+        self.backup_button.configure(state="normal")
+        self.restore_button.configure(state="normal")
+
+        success, result = self._restore_state["result"]
+        if success:
+            SettingsStore.reload()
+            CryptoManager.reload()
+            ChangeTracker.bump()
+            messagebox.showinfo("Restore Successful", f"Data restored from:\n{result}")
+            if self.refresh_callback:
+                self.refresh_callback()
+        else:
+            messagebox.showerror("Restore Failed", result)
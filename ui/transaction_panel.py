@@ -3,18 +3,33 @@ from tkinter import ttk, messagebox
 import tkinter as tk
 from datetime import datetime
 from core.transaction_manager import TransactionManager
+from core.recurring import RecurringManager
+from core.currency import CurrencyConverter
+from core.duplicates import DuplicateDetector
+from core.change_tracker import ChangeTracker
 from core.analytics import FinancialAnalytics
+from core.settings_store import SettingsStore
 from utils.validators import InputValidator
 
 
 class TransactionPanel(ctk.CTkFrame):
+    REPEAT_INTERVALS = {
+        "Never": None,
+        "Weekly": ("week", 1),
+        "Monthly": ("month", 1),
+        "Yearly": ("year", 1)
+    }
+
     def __init__(self, parent, refresh_callback=None):
         super().__init__(parent)
 
         self.transaction_manager = TransactionManager()
         self.analytics = FinancialAnalytics()
         self.refresh_callback = refresh_callback
-        self.categories = self.transaction_manager.get_all_categories()
+        self.categories = []
+        self.categories_generation = None
+        self.rendered_key = None
+        self.refresh_categories()
 
         self.configure(fg_color="transparent")
 
@@ -43,6 +58,16 @@ class TransactionPanel(ctk.CTkFrame):
         self.amount_entry = ctk.CTkEntry(amount_frame, placeholder_text="Enter amount")
         self.amount_entry.pack(fill="x", pady=(0, 5))
 
+        currency_frame = ctk.CTkFrame(self.input_frame, fg_color="transparent")
+        currency_frame.pack(fill="x", pady=5, padx=20)
+
+        currency_label = ctk.CTkLabel(currency_frame, text="CURRENCY:")
+        currency_label.pack(anchor="w")
+
+        self.currency_entry = ctk.CTkEntry(currency_frame, placeholder_text="3-letter code, e.g. USD")
+        self.currency_entry.insert(0, CurrencyConverter.base_currency())
+        self.currency_entry.pack(fill="x", pady=(0, 5))
+
         category_frame = ctk.CTkFrame(self.input_frame, fg_color="transparent")
         category_frame.pack(fill="x", pady=5, padx=20)
 
@@ -83,6 +108,16 @@ class TransactionPanel(ctk.CTkFrame):
         self.date_entry.insert(0, current_date)
         self.date_entry.pack(fill="x", pady=(0, 5))
 
+        repeat_frame = ctk.CTkFrame(self.input_frame, fg_color="transparent")
+        repeat_frame.pack(fill="x", pady=5, padx=20)
+
+        repeat_label = ctk.CTkLabel(repeat_frame, text="REPEAT:")
+        repeat_label.pack(anchor="w")
+
+        self.repeat_var = ctk.StringVar(value="Never")
+        self.repeat_menu = ctk.CTkOptionMenu(repeat_frame, variable=self.repeat_var, values=list(self.REPEAT_INTERVALS))
+        self.repeat_menu.pack(fill="x", pady=(0, 5))
+
         button_frame = ctk.CTkFrame(self.input_frame, fg_color="transparent")
         button_frame.pack(fill="x", pady=15, padx=20)
 
@@ -143,6 +178,7 @@ class TransactionPanel(ctk.CTkFrame):
 
     def add_transaction(self):
         amount_str = self.amount_entry.get()
+        currency = self.currency_entry.get()
         category = self.category_entry.get()
         description = self.description_entry.get()
         is_income = self.transaction_type.get() == "income"
@@ -153,6 +189,15 @@ class TransactionPanel(ctk.CTkFrame):
             messagebox.showerror("Invalid Amount", amount_result)
             return
 
+        valid_currency, currency_result = InputValidator.validate_currency(currency)
+        if not valid_currency:
+            messagebox.showerror("Invalid Currency", currency_result)
+            return
+
+        if not CurrencyConverter.has_rates(currency_result):
+            messagebox.showerror("Invalid Currency", f"No exchange rates for {currency_result}. Import them in Settings first.")
+            return
+
         valid_category, category_result = InputValidator.validate_category(category)
         if not valid_category:
             messagebox.showerror("Invalid Category", category_result)
@@ -172,17 +217,46 @@ class TransactionPanel(ctk.CTkFrame):
             balance_data = self.analytics.get_monthly_balance()
             current_balance = balance_data["income"] - balance_data["expenses"]
 
-            if amount_result > current_balance:
+            if CurrencyConverter.convert_one(amount_result, currency_result, date_result) > current_balance:
                 messagebox.showerror("Insufficient Funds", f"This expense of ${amount_result:.2f} would result in a negative balance. Current balance: ${current_balance:.2f}")
                 return
 
-        transaction = self.transaction_manager.add_transaction(
-            amount=amount_result,
-            category_name=category_result,
-            description=description,
-            is_income=is_income,
-            date=date_result
+        # Checked here, before anything is written, so the user can still back out.
+        matches = DuplicateDetector.find_duplicates(
+            amount_result, category_result, description, date_result, currency_result,
+            window_days=DuplicateDetector.WINDOW_DAYS
         )
+        if matches:
+            similar = "\n".join(
+                f"{record.date:%Y-%m-%d}  {record.category}  {record.amount:.2f} {record.currency}"
+                for record in DuplicateDetector.get_matches(matches[:5])
+            )
+            if not messagebox.askyesno("Possible Duplicate", f"Similar transactions already exist:\n{similar}\n\nAdd it anyway?"):
+                return
+
+        repeat = self.REPEAT_INTERVALS[self.repeat_var.get()]
+        if repeat:
+            interval_unit, interval_count = repeat
+            transaction = RecurringManager.add_rule(
+                amount=amount_result,
+                category_name=category_result,
+                description=description,
+                is_income=is_income,
+                start_date=date_result.date(),
+                interval_unit=interval_unit,
+                interval_count=interval_count,
+                currency=currency_result
+            )
+        else:
+            transaction = self.transaction_manager.add_transaction(
+                amount=amount_result,
+                category_name=category_result,
+                description=description,
+                is_income=is_income,
+                date=date_result,
+                currency=currency_result,
+                flag_duplicates=False
+            )
 
         if transaction:
             messagebox.showinfo("Success", "Transaction added successfully")
@@ -197,32 +271,34 @@ class TransactionPanel(ctk.CTkFrame):
     def clear_form(self):
         self.category_entry.delete(0, tk.END)
         self.amount_entry.delete(0, tk.END)
+        self.currency_entry.delete(0, tk.END)
+        self.currency_entry.insert(0, CurrencyConverter.base_currency())
         self.description_entry.delete(0, tk.END)
         self.transaction_type.set("expense")
+        self.repeat_var.set("Never")
         self.date_entry.delete(0, tk.END)
         self.date_entry.insert(0, datetime.now().strftime("%Y-%m-%d"))
 
     def refresh_categories(self):
+        generation = ChangeTracker.generation()
+        if generation == self.categories_generation:
+            return
+
         self.categories = self.transaction_manager.get_all_categories()
+        self.categories_generation = generation
+
+    def refresh_transactions(self, force=False):
+        # Recurring rows depend on today's date as well as on the data.
+        key = (ChangeTracker.generation(), datetime.now().date())
+        if not force and key == self.rendered_key:
+            return
 
-    def refresh_transactions(self):
         for item in self.tree.get_children():
             self.tree.delete(item)
 
-        df = self.analytics.get_transaction_history()
-
-        for _, row in df.iterrows():
-            date = row["date"].strftime("%Y-%m-%d")
-            amount = f"${row["amount"]:.2f}"
-            type_str = "Income" if row["is_income"] else "Expense"
-
-            self.tree.insert("", tk.END, iid=row["id"], values=(
-                date,
-                row["category"],
-                row["description"] or "",
-                amount,
-                type_str
-            ))
+        records = self.analytics.get_transaction_records(limit=SettingsStore.get("history_page_size"))
+        self.show_records(records)
+        self.rendered_key = key
 
     def search_transactions(self):
         search_term = self.search_entry.get().lower()
@@ -233,23 +309,31 @@ class TransactionPanel(ctk.CTkFrame):
 
         for item in self.tree.get_children():
             self.tree.delete(item)
-
-        df = self.analytics.get_transaction_history()
-
-        df_filtered = df[
-            df["description"].str.lower().str.contains(search_term, na=False) |
-            df["category"].str.lower().str.contains(search_term, na=False)
-            ]
-
-        for _, row in df_filtered.iterrows():
-            date = row["date"].strftime("%Y-%m-%d")
-            amount = f"${row["amount"]:.2f}"
-            type_str = "Income" if row["is_income"] else "Expense"
-
-            self.tree.insert("", tk.END, iid=row["id"], values=(
+        self.rendered_key = None
+
+        records = self.analytics.get_transaction_records(limit=SettingsStore.get("history_page_size"))
+
+        filtered_records = [
+            record for record in records
+            if search_term in (record.description or "").lower() or search_term in record.category.lower()
+        ]
+        self.show_records(filtered_records)
+
+    def show_records(self, records):
+        for record in records:
+            date = record.date.strftime("%Y-%m-%d")
+            if record.currency == CurrencyConverter.base_currency():
+                amount = f"${record.amount:.2f}"
+            else:
+                amount = f"{record.amount:.2f} {record.currency}"
+            type_str = "Income" if record.is_income else "Expense"
+            if record.is_recurring:
+                type_str += " (recurring)"
+
+            self.tree.insert("", tk.END, iid=record.id, values=(
                 date,
-                row["category"],
-                row["description"] or "",
+                record.category,
+                record.description or "",
                 amount,
                 type_str
             ))
@@ -261,8 +345,21 @@ class TransactionPanel(ctk.CTkFrame):
             messagebox.showwarning("No Selection", "Please select a transaction to delete")
             return
 
-        if messagebox.askyesno("Delete Transaction", "Are you sure you want to delete this transaction?"):
+        if any(item_id.startswith("R") for item_id in selected_item):
+            message = "Deleting a recurring entry removes its whole schedule. Are you sure?"
+        else:
+            message = "Are you sure you want to delete this transaction?"
+
+        if messagebox.askyesno("Delete Transaction", message):
+            rule_ids = {int(item_id[1:].split(":")[0]) for item_id in selected_item if item_id.startswith("R")}
+            for rule_id in rule_ids:
+                if not RecurringManager.delete_rule(rule_id):
+                    messagebox.showerror("Error", f"Failed to delete recurring transaction {rule_id}")
+
             for item_id in selected_item:
+                if item_id.startswith("R"):
+                    continue
+
                 success = self.transaction_manager.delete_transaction(int(item_id))
 
                 if not success:
@@ -0,0 +1,313 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime
+from database.db import db, JOURNAL_TABLE, upgrade_schema, rebuild_derived_tables
+from utils.crypto import CryptoManager
+
+
+class BackupManager:
+    PAGES_PER_STEP = 64
+    STEP_SLEEP = 0.005
+    KEEP_FULL_SNAPSHOTS = 5
+    MAX_DELTAS_PER_BASE = 20
+
+    @staticmethod
+    def backup_dir():
+        return os.path.join(os.path.dirname(os.path.abspath(db.database)), "backups")
+
+    @staticmethod
+    def _manifest_path():
+        return os.path.join(BackupManager.backup_dir(), "manifest.json")
+
+    @staticmethod
+    def _load_manifest():
+        try:
+            with open(BackupManager._manifest_path()) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {"snapshots": [], "force_full": False}
+
+    @staticmethod
+    def _save_manifest(manifest):
+        temp_path = BackupManager._manifest_path() + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(manifest, file, indent=2)
+        os.replace(temp_path, BackupManager._manifest_path())
+
+    @staticmethod
+    def _sha256(file_path):
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _journal_seq(connection):
+        return connection.execute(f'SELECT COALESCE(MAX(id), 0) FROM "{JOURNAL_TABLE}"').fetchone()[0]
+
+    @staticmethod
+    def require_full_snapshot():
+        # Called after changes that deltas cannot express, such as a column type change.
+        if os.path.exists(BackupManager._manifest_path()):
+            manifest = BackupManager._load_manifest()
+            manifest["force_full"] = True
+            BackupManager._save_manifest(manifest)
+
+    @staticmethod
+    def list_snapshots():
+        return BackupManager._load_manifest()["snapshots"]
+
+    @staticmethod
+    def create_snapshot(full=False, progress=None):
+        try:
+            os.makedirs(BackupManager.backup_dir(), exist_ok=True)
+            manifest = BackupManager._load_manifest()
+            snapshots = manifest["snapshots"]
+
+            base = next((s for s in reversed(snapshots) if s["kind"] == "full"), None)
+            deltas_since_base = len(snapshots) - snapshots.index(base) - 1 if base else 0
+
+            # The sqlite3 module connection is opened here rather than borrowed from peewee,
+            # so a snapshot can run on a worker thread while the UI keeps using the database.
+            source = sqlite3.connect(db.database)
+            try:
+                if full or manifest["force_full"] or base is None or deltas_since_base >= BackupManager.MAX_DELTAS_PER_BASE:
+                    entry = BackupManager._full_snapshot(source, progress)
+                else:
+                    entry = BackupManager._delta_snapshot(source, snapshots[-1]["journal_seq"])
+            finally:
+                source.close()
+
+            if entry is None:
+                return True, "No changes since the last snapshot"
+
+            snapshots.append(entry)
+            manifest["force_full"] = False
+            BackupManager._rotate(manifest)
+            BackupManager._save_manifest(manifest)
+            BackupManager.prune_journal()
+            return True, os.path.join(BackupManager.backup_dir(), entry["file"])
+        except (sqlite3.Error, OSError) as error:
+            return False, f"Backup failed: {error}"
+
+    @staticmethod
+    def _snapshot_name(kind, extension):
+        return f"snapshot-{datetime.now():%Y%m%d-%H%M%S-%f}-{kind}.{extension}.gz"
+
+    @staticmethod
+    def _full_snapshot(source, progress):
+        file_name = BackupManager._snapshot_name("full", "db")
+        file_path = os.path.join(BackupManager.backup_dir(), file_name)
+
+        fd, temp_path = tempfile.mkstemp(suffix=".db", dir=BackupManager.backup_dir())
+        os.close(fd)
+        try:
+            target = sqlite3.connect(temp_path)
+            try:
+                # Copy a few pages at a time; writers on other connections are only
+                # blocked for the duration of a single step.
+                source.backup(
+                    target,
+                    pages=BackupManager.PAGES_PER_STEP,
+                    progress=(lambda status, remaining, total: progress(total - remaining, total)) if progress else None,
+                    sleep=BackupManager.STEP_SLEEP
+                )
+                journal_seq = BackupManager._journal_seq(target)
+            finally:
+                target.close()
+
+            with open(temp_path, "rb") as raw, gzip.open(file_path, "wb") as compressed:
+                shutil.copyfileobj(raw, compressed)
+        finally:
+            os.remove(temp_path)
+
+        return {
+            "file": file_name,
+            "kind": "full",
+            "journal_seq": journal_seq,
+            "sha256": BackupManager._sha256(file_path),
+            "created": datetime.now().isoformat(timespec="seconds")
+        }
+
+    @staticmethod
+    def _delta_snapshot(source, since_seq):
+        # A single read transaction keeps the journal and the rows it points at consistent.
+        source.execute("BEGIN")
+        try:
+            journal_seq = BackupManager._journal_seq(source)
+            if journal_seq <= since_seq:
+                return None
+
+            changed = {}
+            for table_name, row_id in source.execute(
+                    f'SELECT DISTINCT table_name, row_id FROM "{JOURNAL_TABLE}" '
+                    f'WHERE id > ? AND id <= ? AND table_name != ?',
+                    (since_seq, journal_seq, JOURNAL_TABLE)):
+                changed.setdefault(table_name, set()).add(row_id)
+
+            tables = {}
+            for table_name, row_ids in changed.items():
+                row_ids = sorted(row_ids)
+                cursor = source.execute(f'SELECT * FROM "{table_name}" LIMIT 0')
+                columns = [column[0] for column in cursor.description]
+
+                rows = []
+                for start in range(0, len(row_ids), 500):
+                    chunk = row_ids[start:start + 500]
+                    placeholders = ", ".join("?" * len(chunk))
+                    rows.extend(source.execute(
+                        f'SELECT * FROM "{table_name}" WHERE id IN ({placeholders})', chunk).fetchall())
+
+                present = {row[columns.index("id")] for row in rows}
+                tables[table_name] = {
+                    "columns": columns,
+                    "upserts": rows,
+                    "deletes": [row_id for row_id in row_ids if row_id not in present]
+                }
+        finally:
+            source.execute("COMMIT")
+
+        file_name = BackupManager._snapshot_name("delta", "json")
+        file_path = os.path.join(BackupManager.backup_dir(), file_name)
+        with gzip.open(file_path, "wt", encoding="utf-8") as file:
+            json.dump({"from_seq": since_seq, "journal_seq": journal_seq, "tables": tables}, file)
+
+        return {
+            "file": file_name,
+            "kind": "delta",
+            "journal_seq": journal_seq,
+            "sha256": BackupManager._sha256(file_path),
+            "created": datetime.now().isoformat(timespec="seconds")
+        }
+
+    @staticmethod
+    def _rotate(manifest):
+        snapshots = manifest["snapshots"]
+        full_indexes = [i for i, s in enumerate(snapshots) if s["kind"] == "full"]
+        if len(full_indexes) <= BackupManager.KEEP_FULL_SNAPSHOTS:
+            return
+
+        cutoff = full_indexes[-BackupManager.KEEP_FULL_SNAPSHOTS]
+        for snapshot in snapshots[:cutoff]:
+            try:
+                os.remove(os.path.join(BackupManager.backup_dir(), snapshot["file"]))
+            except FileNotFoundError:
+                pass
+        manifest["snapshots"] = snapshots[cutoff:]
+
+    @staticmethod
+    def prune_journal():
+        # Deltas always start at the newest snapshot, so older entries are never read again, and
+        # without a snapshot to build on the next backup is a full one that needs none of them.
+        # The newest entry stays so ids, and with them get_data_version(), keep increasing.
+        manifest = BackupManager._load_manifest()
+        journal_seq = BackupManager._journal_seq(db.connection())
+        if manifest["snapshots"] and not manifest["force_full"]:
+            journal_seq = min(manifest["snapshots"][-1]["journal_seq"], journal_seq)
+        db.execute_sql(f'DELETE FROM "{JOURNAL_TABLE}" WHERE id < ?', (journal_seq,))
+
+    @staticmethod
+    def _chain(snapshots, file_name):
+        target = next((i for i, s in enumerate(snapshots) if s["file"] == file_name), None)
+        if target is None:
+            return None
+
+        base = max((i for i in range(target + 1) if snapshots[i]["kind"] == "full"), default=None)
+        if base is None:
+            return None
+        return snapshots[base:target + 1]
+
+    @staticmethod
+    def restore_snapshot(file_name=None, progress=None):
+        snapshots = BackupManager.list_snapshots()
+        if not snapshots:
+            return False, "No snapshots available"
+
+        chain = BackupManager._chain(snapshots, file_name or snapshots[-1]["file"])
+        if not chain:
+            return False, f"Snapshot '{file_name}' was not found"
+
+        for snapshot in chain:
+            file_path = os.path.join(BackupManager.backup_dir(), snapshot["file"])
+            if not os.path.exists(file_path) or BackupManager._sha256(file_path) != snapshot["sha256"]:
+                return False, f"Snapshot '{snapshot['file']}' is missing or corrupted"
+
+        live_seq = BackupManager._journal_seq(db.connection())
+        fd, temp_path = tempfile.mkstemp(suffix=".db", dir=BackupManager.backup_dir())
+        os.close(fd)
+        try:
+            with gzip.open(os.path.join(BackupManager.backup_dir(), chain[0]["file"]), "rb") as compressed, \
+                    open(temp_path, "wb") as raw:
+                shutil.copyfileobj(compressed, raw)
+
+            staged = sqlite3.connect(temp_path)
+            try:
+                with staged:
+                    for snapshot in chain[1:]:
+                        BackupManager._apply_delta(staged, snapshot)
+
+                if staged.execute("PRAGMA integrity_check").fetchone()[0] != "ok":
+                    return False, "Restored database failed the integrity check"
+
+                db.close()
+                live = sqlite3.connect(db.database)
+                try:
+                    staged.backup(
+                        live,
+                        pages=BackupManager.PAGES_PER_STEP,
+                        progress=(lambda status, remaining, total: progress(total - remaining, total)) if progress else None
+                    )
+                finally:
+                    live.close()
+            finally:
+                staged.close()
+        except (sqlite3.Error, OSError, ValueError) as error:
+            return False, f"Restore failed: {error}"
+        finally:
+            os.remove(temp_path)
+            if db.is_closed():
+                db.connect()
+
+        # The live journal no longer lines up with the snapshot chain, and the
+        # snapshot may predate the current schema and the current key.
+        BackupManager.require_full_snapshot()
+        CryptoManager.reload()
+        upgrade_schema()
+        BackupManager._mark_restore(live_seq)
+        # Deltas do not carry the derived tables, so they are rebuilt from the restored transactions.
+        rebuild_derived_tables(force=True)
+        return True, chain[-1]["file"]
+
+    @staticmethod
+    def _mark_restore(live_seq):
+        # The restored journal ends below the one it replaced, and get_data_version() must not
+        # hand out a version again for different data. A marker entry past both moves it on;
+        # it names the journal itself, which deltas skip.
+        marker_id = max(live_seq, BackupManager._journal_seq(db.connection())) + 1
+        db.execute_sql(
+            f'INSERT INTO "{JOURNAL_TABLE}" (id, table_name, row_id, operation) VALUES (?, ?, ?, ?)',
+            (marker_id, JOURNAL_TABLE, marker_id, "RESTORE")
+        )
+
+    @staticmethod
+    def _apply_delta(connection, snapshot):
+        with gzip.open(os.path.join(BackupManager.backup_dir(), snapshot["file"]), "rt", encoding="utf-8") as file:
+            delta = json.load(file)
+
+        for table_name, changes in delta["tables"].items():
+            columns = ", ".join(f'"{column}"' for column in changes["columns"])
+            placeholders = ", ".join("?" * len(changes["columns"]))
+            connection.executemany(
+                f'INSERT OR REPLACE INTO "{table_name}" ({columns}) VALUES ({placeholders})',
+                changes["upserts"]
+            )
+            connection.executemany(
+                f'DELETE FROM "{table_name}" WHERE id = ?',
+                [(row_id,) for row_id in changes["deletes"]]
+            )
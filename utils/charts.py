@@ -13,7 +13,7 @@ def set_dark_theme():
 
 class ChartGenerator:
     @staticmethod
-    def create_pie_chart(data, frame, theme="Light"):
+    def create_pie_chart(data, frame, theme="Light", on_select=None):
         plt.close("all")
         plt.style.use("default")
 
@@ -36,7 +36,7 @@ class ChartGenerator:
 
         else:
             colors = plt.cm.tab10(np.arange(len(categories)) % 10)
-            ax.pie(
+            wedges, _, _ = ax.pie(
                 values,
                 labels=categories,
                 autopct="%1.1f%%",
@@ -44,6 +44,11 @@ class ChartGenerator:
                 colors=colors
             )
 
+            if on_select:
+                for wedge, category in zip(wedges, categories):
+                    wedge.set_picker(True)
+                    wedge.set_gid(category)
+
             title_color = "black" if theme == "Light" else "white"
             ax.set_title("Expense Breakdown", fontsize=10, color=title_color)
 
@@ -51,6 +56,9 @@ class ChartGenerator:
         chart = FigureCanvasTkAgg(fig, frame)
         chart.draw()
 
+        if on_select:
+            chart.mpl_connect("pick_event", lambda event: on_select(event.artist.get_gid()))
+
         frame._chart_reference = chart
         return chart
 
@@ -76,7 +84,7 @@ class ChartGenerator:
         ax.bar(x + width / 2, expenses, width, label="Expenses", color=expense_color)
 
         title_color = "black" if theme == "Light" else "white"
-        ax.set_title("Monthly Income vs. Expenses", fontsize=10, color=title_color)
+        ax.set_title("Income vs. Expenses", fontsize=10, color=title_color)
         ax.set_xticks(x)
         ax.set_xticklabels(months, fontsize=8, color=title_color)
         ax.tick_params(axis="y", labelsize=8, colors=title_color)
@@ -94,7 +102,7 @@ class ChartGenerator:
         return chart
 
     @staticmethod
-    def create_line_chart(data, frame, theme="Light"):
+    def create_line_chart(data, frame, theme="Light", forecast=None):
         plt.close("all")
         plt.style.use("default")
 
@@ -107,12 +115,22 @@ class ChartGenerator:
 
         line_color = "#2196F3"
 
-        ax.plot(months, balances, marker="o", linestyle="-", linewidth=2, color=line_color)
+        x_positions = np.arange(len(months))
+        ax.plot(x_positions, balances, marker="o", linestyle="-", linewidth=2, color=line_color)
+
+        if forecast:
+            forecast_positions = np.arange(len(months), len(months) + len(forecast))
+            forecast_balances = [item["balance"] for item in forecast]
+            months = months + [item["month"] for item in forecast]
+
+            # Start the dashed line at the last actual point so the two read as one series.
+            ax.plot(np.concatenate([x_positions[-1:], forecast_positions]), balances[-1:] + forecast_balances,
+                    marker="o", linestyle="--", linewidth=2, color=line_color, alpha=0.5)
+            x_positions = np.concatenate([x_positions, forecast_positions])
 
         title_color = "black" if theme == "Light" else "white"
 
-        ax.set_title("Monthly Balance Trend", fontsize=10, color=title_color)
-        x_positions = np.arange(len(months))
+        ax.set_title("Balance Trend", fontsize=10, color=title_color)
         ax.set_xticks(x_positions)
         ax.set_xticklabels(months, fontsize=8, color=title_color)
         ax.tick_params(axis="y", labelsize=8, colors=title_color)
@@ -123,3 +141,33 @@ class ChartGenerator:
 
         frame._chart_reference = chart
         return chart
+
+    @staticmethod
+    def create_category_chart(data, frame, theme="Light", title=""):
+        plt.close("all")
+        plt.style.use("default")
+
+        if theme == "Dark":
+            set_dark_theme()
+
+        fig, ax = plt.subplots(figsize=(6, 2.5))
+        months = [item["month"] for item in data]
+        totals = [item["total"] for item in data]
+        x = np.arange(len(months))
+
+        ax.bar(x, totals, color="#2196F3")
+
+        # Long histories would crowd the axis, so at most twelve month labels are shown.
+        step = max(len(months) // 12, 1)
+        title_color = "black" if theme == "Light" else "white"
+        ax.set_title(title, fontsize=10, color=title_color)
+        ax.set_xticks(x[::step])
+        ax.set_xticklabels(months[::step], fontsize=8, color=title_color, rotation=45)
+        ax.tick_params(axis="y", labelsize=8, colors=title_color)
+        ax.grid(True, linestyle="--", alpha=0.3)
+        fig.tight_layout()
+        chart = FigureCanvasTkAgg(fig, frame)
+        chart.draw()
+
+        frame._chart_reference = chart
+        return chart
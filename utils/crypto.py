@@ -1,29 +1,160 @@
+import json
+import os
+import secrets
+from database.db import db
+
+
 class CryptoManager:
     _a, _b = 17, 21
     _str_key = 1
+    LEGACY_KEY_ID = 1
+    # Amounts are encrypted as whole cents, so ciphertexts and their SQL sums stay exact integers.
+    AMOUNT_SCALE = 100
+
+    # Key material lives in a keyring file next to the database, never in the database itself.
+    # Keys are only ever added, so rows and backups written under an older key stay readable.
+    _keys = None
+    _active_key_id = None
+    # The keyring also holds a random secret for keyed hashes of plaintext, under this entry.
+    FINGERPRINT_ENTRY = "fingerprint"
+    _fingerprint_key = None
+
+    @staticmethod
+    def _keyring_path():
+        return os.path.join(os.path.dirname(os.path.abspath(db.database)), "keyring.json")
+
+    @classmethod
+    def _read_keyring(cls):
+        try:
+            with open(cls._keyring_path()) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    @classmethod
+    def _write_keyring(cls, keyring):
+        temp_path = cls._keyring_path() + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(keyring, file, indent=2)
+        os.replace(temp_path, cls._keyring_path())
+
+    @classmethod
+    def load_keys(cls, keys=None):
+        if keys is None:
+            keys = {cls.LEGACY_KEY_ID: (cls._a, cls._b, cls._str_key)}
+            keys.update({int(key_id): tuple(key) for key_id, key in cls._read_keyring().items()
+                         if key_id != cls.FINGERPRINT_ENTRY})
+        cls._keys = keys
+        return keys
+
+    @classmethod
+    def key_material(cls):
+        return dict(cls._keys if cls._keys is not None else cls.load_keys())
+
+    @classmethod
+    def add_key(cls):
+        keys = cls.key_material()
+        key_id = max(keys) + 1
+        keys[key_id] = (3 + secrets.randbelow(95), 1 + secrets.randbelow(1000), 1 + secrets.randbelow(255))
+
+        keyring = cls._read_keyring()
+        keyring.update({str(key_id): list(key) for key_id, key in keys.items()})
+        cls._write_keyring(keyring)
+
+        cls._keys = keys
+        return key_id
 
     @classmethod
-    def encrypt_number(cls, number):
-        a, b = cls._a , cls._b
-        encrypted_number = a * number + b
+    def fingerprint_key(cls):
+        # Created on first use and never rotated, so stored fingerprints stay comparable across key rotations.
+        if cls._fingerprint_key is None:
+            keyring = cls._read_keyring()
+            if cls.FINGERPRINT_ENTRY not in keyring:
+                keyring[cls.FINGERPRINT_ENTRY] = secrets.token_hex(32)
+                cls._write_keyring(keyring)
+            cls._fingerprint_key = bytes.fromhex(keyring[cls.FINGERPRINT_ENTRY])
+        return cls._fingerprint_key
+
+    @classmethod
+    def active_key_id(cls):
+        # The active key is recorded in the database by the rotation that introduced it,
+        # so switching keys commits together with the rows it applies to.
+        if cls._active_key_id is None:
+            from database.models import KeyRotation
+            rotation = (KeyRotation
+                        .select()
+                        .where(KeyRotation.finished.is_null(False))
+                        .order_by(KeyRotation.id.desc())
+                        .first())
+            cls._active_key_id = rotation.target_key_id if rotation else cls.LEGACY_KEY_ID
+        return cls._active_key_id
+
+    @classmethod
+    def reload(cls):
+        cls._keys = None
+        cls._active_key_id = None
+        cls._fingerprint_key = None
+
+    @classmethod
+    def _key(cls, key_id):
+        keys = cls._keys if cls._keys is not None else cls.load_keys()
+        return keys[cls.active_key_id() if key_id is None else key_id]
+
+    @classmethod
+    def encrypt_number(cls, number, key_id=None):
+        a, b, _ = cls._key(key_id)
+        encrypted_number = a * round(number * cls.AMOUNT_SCALE) + b
         return encrypted_number
 
     @classmethod
-    def decrypt_number(cls, encrypted_number):
-        a, b = cls._a, cls._b
-        decrypted_number = (encrypted_number - b) / a
+    def decrypt_number(cls, encrypted_number, key_id=None):
+        a, b, _ = cls._key(key_id)
+        decrypted_number = (encrypted_number - b) // a / cls.AMOUNT_SCALE
         return decrypted_number
 
     @classmethod
-    def encrypt_string(cls, plain_text):
+    def decrypt_sum(cls, encrypted_total, count, key_id=None):
+        # The number cipher is affine, so a SQL SUM over n encrypted values decrypts in one step.
+        a, b, _ = cls._key(key_id)
+        return (encrypted_total - count * b) // a / cls.AMOUNT_SCALE
+
+    @classmethod
+    def string_decrypter(cls):
+        # Categories and descriptions repeat a lot, so the returned function decrypts each distinct
+        # (ciphertext, key) once and hands the same string object back after that.
+        decrypted = {}
+
+        def decrypt(encrypted_text, key_id=None):
+            if (encrypted_text, key_id) not in decrypted:
+                decrypted[encrypted_text, key_id] = cls.decrypt_string(encrypted_text, key_id)
+            return decrypted[encrypted_text, key_id]
+
+        return decrypt
+
+    @classmethod
+    def encrypt_string(cls, plain_text, key_id=None):
+        str_key = cls._key(key_id)[2]
         encrypted = ""
         for char in plain_text:
-            encrypted += chr((ord(char) + cls._str_key))
+            encrypted += chr((ord(char) + str_key))
         return encrypted
 
     @classmethod
-    def decrypt_string(cls, encrypted_text):
+    def decrypt_string(cls, encrypted_text, key_id=None):
+        str_key = cls._key(key_id)[2]
         decrypted = ""
         for char in encrypted_text:
-            decrypted += chr((ord(char) - cls._str_key))
+            decrypted += chr((ord(char) - str_key))
         return decrypted
+
+    @classmethod
+    def reencrypt_rows(cls, rows, target_key_id):
+        # rows are (id, amount, category, description, key_id) tuples; the result is ordered for an
+        # UPDATE ... SET amount, category_name, description, key_id WHERE id. Runs in rotation workers.
+        return [(
+            cls.encrypt_number(cls.decrypt_number(amount, key_id), target_key_id),
+            cls.encrypt_string(cls.decrypt_string(category_name, key_id), target_key_id),
+            cls.encrypt_string(cls.decrypt_string(description, key_id), target_key_id) if description else description,
+            target_key_id,
+            row_id
+        ) for row_id, amount, category_name, description, key_id in rows]
@@ -1,19 +1,109 @@
 import csv
+import gzip
+import json
+import os
 
-def export_transactions(transactions, file_path="transactions"):
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+EXPORT_FORMATS = {
+    "CSV": ".csv",
+    "CSV (gzip)": ".csv.gz",
+    "CSV (zstd)": ".csv.zst",
+    "JSON Lines": ".jsonl",
+    "Parquet": ".parquet",
+    "Arrow IPC": ".arrow"
+}
+
+
+def available_formats():
+    formats = ["CSV", "CSV (gzip)"]
+    if zstandard is not None:
+        formats.append("CSV (zstd)")
+    formats.append("JSON Lines")
+    if pa is not None:
+        formats.extend(["Parquet", "Arrow IPC"])
+    return formats
+
+
+def _open_text(file_path, export_format):
+    if export_format == "CSV (gzip)":
+        # Level 6 is several times faster than gzip's default of 9 for nearly the same size.
+        return gzip.open(file_path, "wt", compresslevel=6, newline="", encoding="utf-8")
+    if export_format == "CSV (zstd)":
+        return zstandard.open(file_path, "wt", newline="", encoding="utf-8")
+    return open(file_path, "w", newline="", encoding="utf-8")
+
+
+def _csv_value(value):
+    return f"{value:.2f}" if isinstance(value, float) else value
+
+
+def _write_csv(batches, file_path, export_format):
+    with _open_text(file_path, export_format) as file:
+        writer = None
+        for rows in batches:
+            if writer is None:
+                writer = csv.writer(file)
+                writer.writerow(rows[0].keys())
+            writer.writerows([_csv_value(value) for value in row.values()] for row in rows)
+
+
+def _write_json_lines(batches, file_path):
+    with open(file_path, "w", encoding="utf-8") as file:
+        for rows in batches:
+            file.write("".join(json.dumps(row, default=str) + "\n" for row in rows))
+
+
+def _write_columnar(batches, file_path, export_format):
+    # Every batch becomes one row group / record batch, so memory use stays at one batch.
+    writer, schema = None, None
     try:
-        with open(file_path, "w", newline="") as file:
-            if not transactions:
-                return False, "No transactions to export"
-
-            fieldnames = transactions[0].keys()
-            writer = csv.DictWriter(file, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(transactions)
-            return True, file_path
-    except FileNotFoundError:
-        return False, f"Error: The directory for '{file_path}' does not exist."
-    except PermissionError:
-        return False, f"Error: Access to write to this location is denied '{file_path}'."
-    except:
-        return False
+        for rows in batches:
+            table = pa.Table.from_pylist(rows, schema=schema)
+            if writer is None:
+                schema = table.schema
+                if export_format == "Parquet":
+                    writer = pq.ParquetWriter(file_path, table.schema, compression="zstd")
+                else:
+                    writer = pa.ipc.new_file(file_path, table.schema,
+                                             options=pa.ipc.IpcWriteOptions(compression="zstd"))
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def export_transactions(batches, file_path="transactions", export_format="CSV"):
+    if export_format not in available_formats():
+        return False, f"The {export_format} format is not available; install the packages it needs."
+
+    try:
+        if export_format in ("Parquet", "Arrow IPC"):
+            _write_columnar(batches, file_path, export_format)
+        elif export_format == "JSON Lines":
+            _write_json_lines(batches, file_path)
+        else:
+            _write_csv(batches, file_path, export_format)
+        return True, file_path
+    except Exception as error:
+        # A half-written export looks complete to whoever opens it next.
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+        if isinstance(error, FileNotFoundError):
+            return False, f"Error: The directory for '{file_path}' does not exist."
+        if isinstance(error, PermissionError):
+            return False, f"Error: Access to write to this location is denied '{file_path}'."
+        return False, f"Export failed: {error}"
@@ -44,3 +44,10 @@ class InputValidator:
         if len(description.strip()) > 100:
             return False, "The description must not be more than 100 characters."
         return True, description
+
+    @staticmethod
+    def validate_currency(currency):
+        currency = currency.strip().upper()
+        if len(currency) != 3 or not currency.isalpha():
+            return False, "The currency must be a 3-letter code such as USD or EUR."
+        return True, currency